@@ -13,14 +13,89 @@
 # limitations under the License.
 
 import csv
+import decimal
+import itertools
+import logging
+import multiprocessing
+import numbers
 import operator
+import os
 import json
 import datetime
+import tempfile
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from wsgiref.util import FileWrapper
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    from django.core.exceptions import FieldDoesNotExist
+except ImportError:
+    from django.db.models.fields import FieldDoesNotExist
+
+from django.contrib import admin
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db import models
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
 from django.http import HttpResponse
+from django.http import HttpResponseRedirect
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.html import format_html
+
+try:
+    from django.core.urlresolvers import NoReverseMatch, reverse
+except ImportError:
+    from django.urls import NoReverseMatch, reverse
+
+try:
+    from django.conf.urls import url
+except ImportError:
+    from django.urls import re_path as url
+
+from django.conf import settings as django_settings
+
+from lionheart import settings
+
+try:
+    import xlwt
+except ImportError:
+    xlwt = None
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
-import xlwt
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows per worksheet in an XLSX workbook.
+XLSX_MAX_ROWS = 1048576
+
+logger = logging.getLogger(__name__)
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
 
 def handle_field(field):
     if type(field) is datetime.datetime:
@@ -30,160 +105,1194 @@ def handle_field(field):
     else:
         return str(field)
 
+def native_field(field):
+    """
+    Like `handle_field`, but leaves dates, times, numbers, booleans and `None`
+    as they are so writers with typed cells can store them natively.
+    """
+    if type(field) is datetime.datetime:
+        if timezone.is_aware(field):
+            return timezone.make_naive(field)
+        return field
+    elif isinstance(field, (datetime.date, datetime.time, bool, int, float, decimal.Decimal)):
+        return field
+    elif field is None:
+        return None
+    elif type(field) is dict:
+        return json.dumps(field)
+    else:
+        return str(field)
+
+def json_field(field):
+    """
+    Like `handle_field`, but leaves values that `DjangoJSONEncoder` can
+    encode (strings, numbers, booleans, `None`, dates, decimals, UUIDs, dicts
+    and lists) as they are for it to encode. Integers, floats, booleans and
+    `None` keep their JSON types; decimals are written as strings, so they
+    don't lose precision to floats.
+    """
+    if field is None or isinstance(field, (str, text_type, bool, int, float,
+            decimal.Decimal, datetime.date, datetime.time, datetime.timedelta,
+            uuid.UUID, dict, list)):
+        return field
+    else:
+        return str(field)
+
+def parquet_field(field):
+    """
+    Leaves values as they are for `write_parquet` to store in typed columns,
+    except dicts, which are stored as JSON strings.
+    """
+    if type(field) is dict:
+        return json.dumps(field)
+    else:
+        return field
+
+class Echo(object):
+    """
+    File-like object that returns whatever is written to it instead of
+    buffering it, so that `csv.writer` can be used to generate streamed rows.
+    """
+    def write(self, value):
+        return value
+
+def _after_key(fields, after):
+    """
+    Returns a `Q` matching the rows that come after the key `after` in
+    `fields` order. (a, b) > (x, y) is a > x OR (a = x AND b > y), and so on.
+    """
+    condition = Q()
+    for index, field in enumerate(fields):
+        equal = dict(zip(fields[:index], after[:index]))
+        equal[field + '__gt'] = after[index]
+        condition |= Q(**equal)
+    return condition
+
+def keyset_iterator(queryset, fields, chunk_size=None, after=None,
+                    get_key=None):
+    """
+    Iterates over `queryset` ordered by `fields`, fetching at most
+    `chunk_size` rows per query with `.iterator()`. Each query continues
+    after the key of the last row of the previous one (keyset pagination)
+    instead of using an offset. The condition is spelled out as
+    `a > x OR (a = x AND b > y)` rather than a row-value comparison, so each
+    chunk only stays an index range scan if the table has an index on
+    `fields` in that order; without one, every chunk scans and sorts the
+    table. The last of `fields` must be unique, e.g. `pk`.
+
+    :param after: key to start after, as a tuple of values for `fields`
+    :type after: tuple
+
+    :param get_key: returns the tuple of `fields` values of a row (defaults
+    to reading them as attributes)
+    :type get_key: function
+    """
+    if chunk_size is None:
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+
+    if get_key is None:
+        getter = operator.attrgetter(*fields)
+        if len(fields) == 1:
+            get_key = lambda obj: (getter(obj),)
+        else:
+            get_key = getter
+
+    queryset = queryset.order_by(*fields)
+    while True:
+        chunk = queryset
+        if after is not None:
+            chunk = chunk.filter(_after_key(fields, after))
+
+        count = 0
+        for obj in chunk[:chunk_size].iterator():
+            after = tuple(get_key(obj))
+            count += 1
+            yield obj
+
+        if count < chunk_size:
+            break
+
+def queryset_iterator(queryset, chunk_size=None, get_pk=operator.attrgetter('pk')):
+    """
+    Iterates over `queryset` in primary key order, fetching at most
+    `chunk_size` rows per query with `.iterator()`, so only a single chunk of
+    model instances is ever held in memory.
+
+    :param chunk_size: rows to fetch per query (defaults to
+    `settings.EXPORT_CHUNK_SIZE`)
+    :type chunk_size: int
+
+    :param get_pk: returns the primary key of a row, e.g.
+    `operator.itemgetter(0)` for `values_list('pk', ...)` querysets
+    :type get_pk: function
+    """
+    return keyset_iterator(queryset, ('pk',), chunk_size,
+                           get_key=lambda obj: (get_pk(obj),))
+
+def get_export_checkpoint(name, model):
+    """
+    Returns the `(updated_on, pk)` key of the last row exported under the
+    checkpoint `name`, or `None` if nothing has been exported yet.
+    """
+    from lionheart.models import ExportCheckpoint
+
+    if not settings.EXPORT_CHECKPOINTS_ENABLED:
+        raise Exception("EXPORT_CHECKPOINTS_ENABLED must be set to use this feature.")
+
+    try:
+        checkpoint = ExportCheckpoint.objects.get(name=name)
+    except ExportCheckpoint.DoesNotExist:
+        return None
+
+    return (checkpoint.updated_on, model._meta.pk.to_python(checkpoint.last_pk))
+
+def save_export_checkpoint(name, key):
+    """
+    Records `key`, an `(updated_on, pk)` pair, as the last row exported under
+    the checkpoint `name`.
+    """
+    from lionheart.models import ExportCheckpoint
+
+    updated_on, pk = key
+    ExportCheckpoint.objects.update_or_create(name=name, defaults={
+        'updated_on': updated_on,
+        'last_pk': str(pk)})
+
+def _get_field_names(opts, fields, exclude):
+    if fields:
+        return fields
+
+    field_names = set([field.name for field in opts.fields])
+    if exclude:
+        excludeset = set(exclude)
+        field_names = field_names - excludeset
+
+    return field_names
+
+def _get_m2m_columns(m2m_fields):
+    """
+    Returns a list of `(instance, (field_name, group_name))` pairs, one for
+    each m2m column in the export.
+    """
+    m2m_field_names = map(operator.itemgetter("name"), m2m_fields)
+    m2m_field_groups = map(operator.itemgetter("group_by_name"), m2m_fields)
+    m2m_field_group_models = map(operator.itemgetter("group_by_model"), m2m_fields)
+
+    m2m_instances_to_field_names = {}
+    for field_name, group_name, Model in zip(m2m_field_names, m2m_field_groups, m2m_field_group_models):
+        for instance in Model.objects.all():
+            m2m_instances_to_field_names[instance] = (field_name, group_name)
+
+    return list(m2m_instances_to_field_names.items())
+
+def _chunks(objects, chunk_size=None):
+    """
+    Groups `objects` into lists of at most `chunk_size` items, preserving
+    their order.
+    """
+    if chunk_size is None:
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+
+    iterator = iter(objects)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+def _get_m2m_manager(model, pk, field_name):
+    """
+    Returns the related manager for `field_name` on `model(pk=pk)` if it's a
+    many-to-many manager that can be resolved through its through model, or
+    `None` otherwise (e.g. dotted paths or reverse foreign keys).
+    """
+    if "." in field_name:
+        return None
+
+    manager = getattr(model(pk=pk), field_name, None)
+    if not hasattr(manager, 'through'):
+        return None
+
+    return manager
+
+def _prefetch_m2m_values(model, pks, m2m_columns):
+    """
+    Resolves the m2m columns for a chunk of rows with a fixed number of
+    queries per m2m field (the through table, the related objects and their
+    groups) instead of one query per row and column.
+
+    Returns a dict mapping `(field_name, group_name)` to a dict of
+    `(obj.pk, group pk)` to the list of related object strings. Fields which
+    can't be resolved this way are left out and fall back to a query per row.
+    """
+    m2m_values = {}
+    if not pks:
+        return m2m_values
+
+    for _, (field_name, group_name) in m2m_columns:
+        key = (field_name, group_name)
+        if key in m2m_values:
+            continue
+
+        manager = _get_m2m_manager(model, pks[0], field_name)
+        if manager is None:
+            continue
+
+        source_field_name = manager.source_field_name
+        target_field_name = manager.target_field_name
+
+        sources_by_related_pk = {}
+        through_rows = manager.through._default_manager \
+                .filter(**{source_field_name + '__in': pks}) \
+                .values_list(source_field_name, target_field_name)
+        for source_pk, related_pk in through_rows:
+            sources_by_related_pk.setdefault(related_pk, []).append(source_pk)
+
+        related = manager.model._default_manager \
+                .filter(pk__in=list(sources_by_related_pk.keys()))
+
+        groups_by_related_pk = {}
+        for related_pk, group_pk in related.values_list('pk', group_name):
+            groups_by_related_pk.setdefault(related_pk, []).append(group_pk)
+
+        values = {}
+        for related_obj in related:
+            value = str(related_obj)
+            for group_pk in groups_by_related_pk.get(related_obj.pk, []):
+                for source_pk in sources_by_related_pk[related_obj.pk]:
+                    values.setdefault((source_pk, group_pk), []).append(value)
+
+        m2m_values[key] = values
+
+    return m2m_values
+
+# Model field classes whose values are plain column values that can never be
+# a `datetime` or a `dict`, so `str` converts them exactly like `handle_field`.
+_STR_FIELD_TYPES = tuple(filter(None, [getattr(models, name, None) for name in (
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'BooleanField',
+    'NullBooleanField', 'CharField', 'EmailField', 'SlugField', 'URLField',
+    'TextField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+    'PositiveIntegerField', 'PositiveSmallIntegerField',
+    'PositiveBigIntegerField', 'DecimalField', 'FloatField', 'DateField',
+    'TimeField', 'DurationField', 'UUIDField', 'GenericIPAddressField')]))
+
+# Model field classes that can be read with `values_list` and give the same
+# value as the model attribute.
+_PLAIN_FIELD_TYPES = _STR_FIELD_TYPES + (models.DateTimeField,)
+
+def _get_plain_field(model, name):
+    """
+    Returns the concrete model field called `name` if it's a plain column,
+    otherwise `None`.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+    if type(field) in _PLAIN_FIELD_TYPES and field.name == name:
+        return field
+
+    return None
+
+def _datetime_converter():
+    """
+    Returns a `handle_field` equivalent for `DateTimeField` columns that looks
+    up the current time zone once instead of once per value.
+    """
+    tz = timezone.get_current_timezone()
+
+    def convert(value):
+        if type(value) is datetime.datetime:
+            return timezone.make_naive(value, tz)
+        return str(value)
+    return convert
+
+class ExportPlan(object):
+    """
+    Column plan for an admin export, compiled once per export.
+
+    Every column gets a precomputed getter and a converter picked from its
+    model field type, so rows don't pay for attribute path lookups or
+    `handle_field`'s type checks on each cell. When every column is a plain
+    model field (and every m2m column can be prefetched), rows are fetched as
+    `values_list` tuples and no model instances are created.
+
+    'fields', 'additional_fields', 'm2m_fields' and 'exclude' work like they
+    do for the export actions, and 'convert' is applied to each value that
+    isn't known to be a plain string conversion.
+    """
+
+    def __init__(self, model, fields=None, additional_fields=[], m2m_fields={},
+                 exclude=None, convert=handle_field):
+        self.model = model
+        self.last_key = None
+        self.names = list(_get_field_names(model._meta, fields, exclude)) \
+                + list(additional_fields)
+        self.m2m_columns = _get_m2m_columns(m2m_fields)
+
+        model_fields = [_get_plain_field(model, name) for name in self.names]
+        self.use_values_list = all(model_fields) and all(
+            _get_m2m_manager(model, 0, field_name) is not None
+            for _, (field_name, _) in self.m2m_columns)
+
+        if self.use_values_list:
+            getters = [operator.itemgetter(index + 1)
+                       for index in range(len(self.names))]
+            self.get_pk = operator.itemgetter(0)
+        else:
+            getters = [operator.attrgetter(name) for name in self.names]
+            self.get_pk = operator.attrgetter('pk')
+
+        self.model_fields = model_fields
+        self.columns = []
+        for getter, field in zip(getters, model_fields):
+            if convert is handle_field and type(field) in _STR_FIELD_TYPES:
+                self.columns.append((getter, str))
+            elif convert is handle_field and type(field) is models.DateTimeField:
+                self.columns.append((getter, _datetime_converter()))
+            else:
+                self.columns.append((getter, convert))
+
+    def header(self):
+        row = list(self.names)
+        for instance, _ in self.m2m_columns:
+            row.append(text_type(instance))
+        return row
+
+    def queryset(self, queryset, *extra):
+        """
+        Returns `queryset` in the shape this plan reads rows from, with the
+        `extra` fields available through `getter(extra)`.
+        """
+        if self.use_values_list:
+            return queryset.values_list('pk', *(self.names + list(extra)))
+        return queryset
+
+    def getter(self, extra):
+        """
+        Returns a function that reads the `extra` fields passed to
+        `queryset()` from a row, as a tuple.
+        """
+        if self.use_values_list:
+            offset = len(self.names) + 1
+            indexes = [offset + index for index in range(len(extra))]
+            return lambda row: tuple(row[index] for index in indexes)
+        return lambda obj: tuple(getattr(obj, name) for name in extra)
+
+    def incremental_count(self, checkpoint):
+        """
+        Returns the number of rows that an incremental export under
+        `checkpoint` would read.
+        """
+        queryset = self.model._default_manager.all()
+        after = get_export_checkpoint(checkpoint, self.model)
+        if after is not None:
+            queryset = queryset.filter(_after_key(('updated_on', 'pk'), after))
+        return queryset.count()
+
+    def _incremental(self, checkpoint, chunk_size=None, save_checkpoint=True):
+        """
+        Reads the rows of the model's default manager created or updated since
+        the export checkpoint named `checkpoint` in `(updated_on, pk)` order,
+        and records the key of the
+        last row read as `last_key`. With 'save_checkpoint', the checkpoint is
+        then moved to it; otherwise the caller saves `last_key` with
+        `save_export_checkpoint` once the export has been stored.
+
+        `CreatedMixin` doesn't index `updated_on`, so models exported this way
+        should add an index on `(updated_on, id)` to keep each chunk from
+        scanning the whole table:
+
+            class Meta:
+                index_together = (('updated_on', 'id'),)
+        """
+        from lionheart.models import CreatedMixin
+
+        if not issubclass(self.model, CreatedMixin):
+            raise Exception("Incremental exports require a model using CreatedMixin.")
+
+        fields = ('updated_on', 'pk')
+        get_key = self.getter(fields)
+        after = get_export_checkpoint(checkpoint, self.model)
+
+        self.last_key = None
+        queryset = self.model._default_manager.all()
+        for obj in keyset_iterator(self.queryset(queryset, *fields), fields,
+                                   chunk_size, after, get_key):
+            self.last_key = get_key(obj)
+            yield obj
+
+        if save_checkpoint and self.last_key is not None:
+            save_export_checkpoint(checkpoint, self.last_key)
+
+    def rows(self, queryset, header=True, stream=False, chunk_size=None,
+             checkpoint=None, save_checkpoint=True):
+        """
+        Generates the rows of the export of `queryset`, starting with the
+        header row if 'header' is set. With 'stream', the queryset is read in
+        primary key order 'chunk_size' rows at a time.
+
+        With 'checkpoint', `queryset` is ignored and only rows created or
+        updated since the last export under that checkpoint name are
+        generated, from the whole table (see `_incremental`), so a checkpoint
+        never moves past rows that weren't selected. The checkpoint only moves
+        once every row has been generated, so an interrupted export is sent
+        again in full next time.
+        """
+        if header:
+            yield self.header()
+
+        if checkpoint is not None:
+            objects = self._incremental(checkpoint, chunk_size, save_checkpoint)
+        elif stream:
+            objects = queryset_iterator(self.queryset(queryset), chunk_size,
+                                        self.get_pk)
+        else:
+            objects = self.queryset(queryset)
+
+        columns = self.columns
+        get_pk = self.get_pk
+        for chunk in _chunks(objects, chunk_size):
+            if self.m2m_columns:
+                m2m_values = _prefetch_m2m_values(
+                    self.model, [get_pk(obj) for obj in chunk], self.m2m_columns)
+
+            for obj in chunk:
+                row = [convert(getter(obj)) for getter, convert in columns]
+                for instance, (field_name, group_name) in self.m2m_columns:
+                    values = m2m_values.get((field_name, group_name))
+                    if values is None:
+                        field = operator.attrgetter(field_name)(obj)
+                        related = field.filter(**{group_name: instance})
+                        value = ", ".join(map(str, related))
+                    else:
+                        value = ", ".join(values.get((get_pk(obj), instance.pk), []))
+                    row.append(value)
+                yield row
+
+def write_csv(fileobj, rows):
+    """
+    Writes `rows` to the binary file `fileobj` as UTF-8 encoded CSV, one row
+    at a time.
+    """
+    writer = csv.writer(Echo())
+    for row in rows:
+        line = writer.writerow(row)
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        fileobj.write(line)
+
+def write_xls(fileobj, rows, sheet_name="Results"):
+    """
+    Writes `rows` to an XLS workbook in `fileobj`. The workbook is built in
+    memory and is limited to 65,536 rows; see `write_xlsx`.
+    """
+    if xlwt is None:
+        raise Exception("xlwt must be installed to use this feature.")
+
+    book = xlwt.Workbook(encoding="utf-8")
+    sheet = book.add_sheet(sheet_name)
+
+    for row, values in enumerate(rows):
+        for column, value in enumerate(values):
+            sheet.write(row, column, value)
+
+    book.save(fileobj)
+
+def write_xlsx(fileobj, rows, sheet_name="Results"):
+    """
+    Writes `rows` to an XLSX workbook in `fileobj` using xlsxwriter's
+    `constant_memory` mode, which flushes each row to a temporary file as soon
+    as the next one starts. Dates, numbers and booleans are written as native
+    cells, everything else as strings. Rows past the end of a worksheet
+    continue on a new one.
+    """
+    if xlsxwriter is None:
+        raise Exception("xlsxwriter must be installed to use this feature.")
+
+    book = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+    datetime_format = book.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    date_format = book.add_format({'num_format': 'yyyy-mm-dd'})
+    time_format = book.add_format({'num_format': 'hh:mm:ss'})
+
+    sheet = None
+    for index, values in enumerate(rows):
+        row = index % XLSX_MAX_ROWS
+        if row == 0:
+            sheet_number = index // XLSX_MAX_ROWS + 1
+            if sheet_number == 1:
+                sheet = book.add_worksheet(sheet_name)
+            else:
+                sheet = book.add_worksheet("{} ({})".format(sheet_name, sheet_number))
+
+        for column, value in enumerate(values):
+            if value is None:
+                continue
+            elif isinstance(value, bool):
+                sheet.write_boolean(row, column, value)
+            elif isinstance(value, (int, float, decimal.Decimal)):
+                sheet.write_number(row, column, value)
+            elif isinstance(value, datetime.datetime):
+                sheet.write_datetime(row, column, value, datetime_format)
+            elif isinstance(value, datetime.date):
+                sheet.write_datetime(row, column, value, date_format)
+            elif isinstance(value, datetime.time):
+                sheet.write_datetime(row, column, value, time_format)
+            else:
+                sheet.write_string(row, column, value)
+
+    if sheet is None:
+        book.add_worksheet(sheet_name)
+
+    book.close()
+
+def ndjson_lines(rows):
+    """
+    Generates JSON Lines from `rows`, one object per row keyed by the column
+    names in the first row.
+    """
+    rows = iter(rows)
+    names = next(rows, None)
+    if names is None:
+        return
+
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(OrderedDict(zip(names, row))) + "\n"
+
+def write_ndjson(fileobj, rows):
+    """
+    Writes `rows` to the binary file `fileobj` as UTF-8 encoded JSON Lines
+    (see `ndjson_lines`).
+    """
+    for line in ndjson_lines(rows):
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        fileobj.write(line)
+
+def _parquet_type(field):
+    """
+    Returns the Arrow type for values of the model field `field`. Columns
+    without a plain model field are stored as strings.
+    """
+    if isinstance(field, models.BooleanField) or \
+            type(field).__name__ == 'NullBooleanField':
+        return pyarrow.bool_()
+    elif isinstance(field, (models.AutoField, models.IntegerField)):
+        return pyarrow.int64()
+    elif isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    elif isinstance(field, models.DecimalField) and field.max_digits <= 38:
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    elif isinstance(field, models.DateTimeField):
+        if django_settings.USE_TZ:
+            return pyarrow.timestamp('us', tz='UTC')
+        return pyarrow.timestamp('us')
+    elif isinstance(field, models.DateField):
+        return pyarrow.date32()
+    elif isinstance(field, models.TimeField):
+        return pyarrow.time64('us')
+    elif hasattr(models, 'DurationField') and isinstance(field, models.DurationField):
+        return pyarrow.duration('us')
+    else:
+        return pyarrow.string()
+
+def parquet_schema(plan):
+    """
+    Returns the Arrow schema for the columns of the `ExportPlan` `plan`.
+    """
+    if pyarrow is None:
+        raise Exception("pyarrow must be installed to use this feature.")
+
+    types = [_parquet_type(field) for field in plan.model_fields]
+    types.extend(pyarrow.string() for _ in plan.m2m_columns)
+    return pyarrow.schema([pyarrow.field(name, type)
+                           for name, type in zip(plan.header(), types)])
+
+def write_parquet(fileobj, rows, schema, chunk_size=None):
+    """
+    Writes `rows` (without a header) to a Parquet file in `fileobj` with the
+    given Arrow `schema`, one row group per `chunk_size` rows, so only a
+    single chunk of rows is held in memory.
+    """
+    if pyarrow is None:
+        raise Exception("pyarrow must be installed to use this feature.")
+
+    writer = pyarrow.parquet.ParquetWriter(fileobj, schema)
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            arrays = []
+            for values, field in zip(zip(*chunk), schema):
+                if pyarrow.types.is_string(field.type):
+                    values = [value if value is None else text_type(value)
+                              for value in values]
+                arrays.append(pyarrow.array(values, type=field.type))
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+
+def _file_response(output, content_type, filename):
+    """
+    Streams the finished temporary file `output` as an attachment.
+    """
+    length = output.tell()
+    output.seek(0)
+
+    response = StreamingHttpResponse(FileWrapper(output),
+                                     content_type=content_type)
+    response['Content-Length'] = length
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+# Writer, value converter and content type for each export format.
+EXPORT_FORMATS = {
+    'csv': (write_csv, handle_field, 'text/csv'),
+    'ndjson': (write_ndjson, json_field, 'application/x-ndjson'),
+    'xls': (write_xls, handle_field, 'application/ms-excel'),
+    'xlsx': (write_xlsx, native_field, XLSX_CONTENT_TYPE),
+}
+
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+def _get_export_pool():
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            _export_pool = ThreadPool(settings.EXPORT_JOB_WORKERS)
+    return _export_pool
+
+def _track_progress(rows, jobs, header, every=None):
+    """
+    Passes `rows` through, recording the number of data rows written on the
+    `jobs` queryset every `every` rows.
+    """
+    if every is None:
+        every = settings.EXPORT_CHUNK_SIZE
+
+    written = -1 if header else 0
+    for row in rows:
+        yield row
+        written += 1
+        if written > 0 and written % every == 0:
+            jobs.update(rows_written=written)
+
+def run_export_job(job_pk, queryset, format, plan_kwargs, header=True,
+                   chunk_size=None, checkpoint=None):
+    """
+    Writes the export of `queryset` for the `ExportJob` with primary key
+    `job_pk` to a temporary file, then saves it to the job's `file`. Progress
+    and failures are recorded on the job. With 'checkpoint', the checkpoint is
+    only moved once the file has been stored. This runs on the export worker
+    pool, but can also be called directly (e.g. from a management command).
+    """
+    from lionheart.models import ExportJob
+
+    jobs = ExportJob.objects.filter(pk=job_pk)
+    try:
+        write, convert, _ = EXPORT_FORMATS[format]
+        plan = ExportPlan(queryset.model, convert=convert, **plan_kwargs)
+        if checkpoint is None:
+            rows_total = queryset.count()
+        else:
+            rows_total = plan.incremental_count(checkpoint)
+        jobs.update(status=ExportJob.RUNNING, rows_total=rows_total)
+
+        rows = plan.rows(queryset, header, stream=True, chunk_size=chunk_size,
+                         checkpoint=checkpoint, save_checkpoint=False)
+
+        output = tempfile.TemporaryFile()
+        try:
+            write(output, _track_progress(rows, jobs, header, chunk_size))
+            output.seek(0)
+
+            job = jobs.get()
+            # A random directory keeps the stored name from being guessed
+            # from the action's filename.
+            job.file.save('{}/{}'.format(uuid.uuid4().hex, job.filename),
+                          File(output), save=False)
+            with transaction.atomic():
+                if checkpoint is not None and plan.last_key is not None:
+                    save_export_checkpoint(checkpoint, plan.last_key)
+                job.rows_written = job.rows_total
+                job.status = ExportJob.DONE
+                job.save()
+        finally:
+            output.close()
+    except Exception:
+        logger.exception("Export job %s failed", job_pk)
+        jobs.update(status=ExportJob.FAILED, error=traceback.format_exc())
+    finally:
+        # Worker threads open their own connections; don't leak them.
+        for connection in connections.all():
+            connection.close()
+
+def queue_export_job(modeladmin, request, queryset, filename, format,
+                     plan_kwargs, header=True, chunk_size=None,
+                     checkpoint=None):
+    """
+    Creates an `ExportJob` for `queryset` and hands it to the export worker
+    pool once the current transaction commits, then redirects to the job's
+    admin page where its progress and download link are shown.
+
+    Requires `EXPORT_JOBS_ENABLED`. The pool size is `EXPORT_JOB_WORKERS`.
+    """
+    from lionheart.models import ExportJob
+
+    if not settings.EXPORT_JOBS_ENABLED:
+        raise Exception("EXPORT_JOBS_ENABLED must be set to use this feature.")
+
+    job = ExportJob.objects.create(filename=filename, format=format)
+    arguments = (job.pk, queryset.all(), format, plan_kwargs, header,
+                 chunk_size, checkpoint)
+
+    def submit():
+        _get_export_pool().apply_async(run_export_job, arguments)
+
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(submit)
+    else:
+        submit()
+
+    modeladmin.message_user(request, "Export of {} has been queued.".format(filename))
+
+    try:
+        return HttpResponseRedirect(
+            reverse('admin:lionheart_exportjob_change', args=(job.pk,)))
+    except NoReverseMatch:
+        return None
+
+def pk_ranges(queryset, shards):
+    """
+    Splits `queryset` into at most `shards` primary key ranges of equal width,
+    returned in order as `(start, end)` pairs where `start` is inclusive and
+    `end` is exclusive. Querysets with non-integer primary keys come back as a
+    single `(None, None)` range covering everything.
+    """
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    low, high = bounds['low'], bounds['high']
+    if low is None:
+        return []
+
+    if shards <= 1 or not isinstance(low, numbers.Integral) \
+            or not isinstance(high, numbers.Integral):
+        return [(None, None)]
+
+    width = (high - low) // shards + 1
+    return [(start, start + width) for start in range(low, high + 1, width)]
+
+def _filter_pk_range(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(pk__gte=start)
+    if end is not None:
+        queryset = queryset.filter(pk__lt=end)
+    return queryset
+
+def _render_shard(arguments):
+    """
+    Renders one primary key range of an export to a temporary file and
+    returns its path. CSV shards hold the encoded rows; other formats hold the
+    pickled rows, to be written into a single workbook by the parent.
+    """
+    model, query, start, end, format, plan_kwargs, chunk_size = arguments
+    try:
+        _, convert, _ = EXPORT_FORMATS[format]
+        queryset = model._default_manager.all()
+        queryset.query = query
+        queryset = _filter_pk_range(queryset, start, end)
+
+        plan = ExportPlan(model, convert=convert, **plan_kwargs)
+        rows = plan.rows(queryset, header=False, stream=True, chunk_size=chunk_size)
+
+        output = tempfile.NamedTemporaryFile(prefix='export-', delete=False)
+        with output:
+            if format == 'csv':
+                write_csv(output, rows)
+            else:
+                for row in rows:
+                    pickle.dump(row, output, pickle.HIGHEST_PROTOCOL)
+        return output.name
+    finally:
+        for connection in connections.all():
+            connection.close()
+
+def _get_process_pool(workers):
+    """
+    Returns a forked process pool, or `None` where `fork` isn't available.
+    Forking means the workers inherit the configured Django settings and
+    apps, and open their own database connections.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.Pool(workers)
+
+    try:
+        return multiprocessing.get_context('fork').Pool(workers)
+    except ValueError:
+        return None
+
+def sharded_export(queryset, format, plan_kwargs, workers=None, chunk_size=None):
+    """
+    Renders the export of `queryset` in `workers` processes (defaults to
+    `settings.EXPORT_WORKERS`), one primary key range each, and yields the
+    paths of the shard files in primary key order as they become available.
+    Each file is deleted once the next one is requested.
+
+    Concatenating the shards gives the same rows, in the same order, as the
+    single-process streaming export. Returns `None` if the export can't be
+    split, i.e. only one worker, no `fork`, or an open transaction, which the
+    worker processes wouldn't be able to see.
+    """
+    if workers is None:
+        workers = settings.EXPORT_WORKERS
+
+    if workers <= 1 or any(connection.in_atomic_block
+                           for connection in connections.all()):
+        return None
+
+    ranges = pk_ranges(queryset, workers)
+    if len(ranges) <= 1:
+        return None
+
+    # Forked children must not share the parent's database connections.
+    for connection in connections.all():
+        connection.close()
+
+    pool = _get_process_pool(workers)
+    if pool is None:
+        return None
+
+    model = queryset.model
+    arguments = [(model, queryset.query, start, end, format, plan_kwargs, chunk_size)
+                 for start, end in ranges]
+
+    def shards():
+        paths = []
+        try:
+            for path in pool.imap(_render_shard, arguments):
+                paths.append(path)
+                yield path
+                os.remove(path)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return shards()
+
+def _read_shard_bytes(paths, size=64 * 1024):
+    for path in paths:
+        with open(path, 'rb') as shard:
+            for data in iter(lambda: shard.read(size), b''):
+                yield data
+
+def _read_shard_rows(paths):
+    for path in paths:
+        with open(path, 'rb') as shard:
+            while True:
+                try:
+                    yield pickle.load(shard)
+                except EOFError:
+                    break
+
 # http://djangosnippets.org/snippets/2020/
 def export_as_xls_action(filename, description="Export as XLS",
                          fields=None, additional_fields=[], m2m_fields={},
-                         exclude=None, header=True):
+                         exclude=None, header=True, background=False,
+                         incremental=None):
     """
     This function returns an export XLS action
     'fields' and 'exclude' work like in django ModelForm
     'header' is whether or not to output the column names as the first row
+    'background' queues the export as an `ExportJob` instead of building it
+    during the request (see `queue_export_job`)
+    'incremental' names an export checkpoint; only rows created or updated
+    since the last export under that name are included, from the whole table
+    rather than the selected rows (models using `CreatedMixin` only, see
+    `ExportPlan.rows`)
     """
+    plan_kwargs = dict(fields=fields, additional_fields=additional_fields,
+                       m2m_fields=m2m_fields, exclude=exclude)
 
     def export_as_xls(modeladmin, request, queryset):
         """
         Generic xls export admin action.
         based on http://djangosnippets.org/snippets/1697/
         """
-        opts = modeladmin.model._meta
-        if fields:
-            fieldset = set(fields)
-            field_names = fields
-        else:
-            field_names = set([field.name for field in opts.fields])
+        if background:
+            return queue_export_job(modeladmin, request, queryset, filename,
+                                    'xls', plan_kwargs, header,
+                                    checkpoint=incremental)
 
-            if exclude:
-                excludeset = set(exclude)
-                field_names = field_names - excludeset
+        plan = ExportPlan(modeladmin.model, **plan_kwargs)
 
         response = HttpResponse(content_type='application/ms-excel')
         response['Content-Disposition'] = 'attachment; filename=%s' % filename
 
-        book = xlwt.Workbook(encoding="utf-8")
-        sheet = book.add_sheet("Results")
-
-        m2m_field_names = map(operator.itemgetter("name"), m2m_fields)
-        m2m_field_groups = map(operator.itemgetter("group_by_name"), m2m_fields)
-        m2m_field_group_models = map(operator.itemgetter("group_by_model"), m2m_fields)
-
-        m2m_instances_to_field_names = {}
-        for field_name, group_name, Model in zip(m2m_field_names, m2m_field_groups, m2m_field_group_models):
-            for instance in Model.objects.all():
-                m2m_instances_to_field_names[instance] = (field_name, group_name)
-
-        m2m_instances = m2m_instances_to_field_names.keys()
-
-        row = 0
-        if header:
-            column = 0
-            for field_name in field_names:
-                sheet.write(row, column, field_name)
-                column += 1
-
-            for field_name in additional_fields:
-                sheet.write(row, column, field_name)
-                column += 1
+        write_xls(response, plan.rows(queryset, header, checkpoint=incremental))
+        return response
+    export_as_xls.short_description = description
+    return export_as_xls
 
-            for instance in m2m_instances:
-                sheet.write(row, column, unicode(instance))
-                column += 1
+def export_as_xlsx_action(filename, description="Export as XLSX",
+                          fields=None, additional_fields=[], m2m_fields={},
+                          exclude=None, header=True, chunk_size=None,
+                          background=False, workers=None, incremental=None):
+    """
+    This function returns an export XLSX action
+    'fields' and 'exclude' work like in django ModelForm
+    'header' is whether or not to output the column names as the first row
+    'background' queues the export as an `ExportJob` instead of building it
+    during the request (see `queue_export_job`)
+    'workers' renders primary key ranges of the queryset in that many
+    processes (defaults to `settings.EXPORT_WORKERS`, see `sharded_export`)
+    'incremental' names an export checkpoint; only rows created or updated
+    since the last export under that name are included, from the whole table
+    rather than the selected rows (models using `CreatedMixin` only, see
+    `ExportPlan.rows`)
 
-            row += 1
+    Unlike `export_as_xls_action`, the queryset is read in primary key order
+    'chunk_size' rows at a time and the workbook is written to a temporary
+    file as it goes, so memory use stays flat and there's no 65,536 row
+    limit. Dates and numbers are stored as native cells.
+    """
+    plan_kwargs = dict(fields=fields, additional_fields=additional_fields,
+                       m2m_fields=m2m_fields, exclude=exclude)
 
-        for obj in queryset:
-            column = 0
-            for field_name in field_names:
-                sheet.write(row, column, handle_field(operator.attrgetter(field_name)(obj)))
-                column += 1
+    def export_as_xlsx(modeladmin, request, queryset):
+        if background:
+            return queue_export_job(modeladmin, request, queryset, filename,
+                                    'xlsx', plan_kwargs, header, chunk_size,
+                                    incremental)
 
-            for field_name in additional_fields:
-                sheet.write(row, column, handle_field(operator.attrgetter(field_name)(obj)))
-                column += 1
+        plan = ExportPlan(modeladmin.model, convert=native_field, **plan_kwargs)
+        shards = None
+        if incremental is None:
+            shards = sharded_export(queryset, 'xlsx', plan_kwargs, workers, chunk_size)
 
-            for instance, (field_name, group_name) in m2m_instances_to_field_names.items():
-                field = operator.attrgetter(field_name)(obj)
-                queryset = field.filter(**{group_name: instance})
-                value = ", ".join(map(str, queryset))
-                sheet.write(row, column, value)
-                column += 1
+        if shards is None:
+            rows = plan.rows(queryset, header, stream=True, chunk_size=chunk_size,
+                             checkpoint=incremental)
+        else:
+            rows = _read_shard_rows(shards)
+            if header:
+                rows = itertools.chain([plan.header()], rows)
 
-            row += 1
+        output = tempfile.TemporaryFile()
+        write_xlsx(output, rows)
+        return _file_response(output, XLSX_CONTENT_TYPE, filename)
 
-        book.save(response)
-        return response
-    export_as_xls.short_description = description
-    return export_as_xls
+    export_as_xlsx.short_description = description
+    return export_as_xlsx
 
 # http://djangosnippets.org/snippets/2020/
 def export_as_csv_action(filename, description="Export as CSV",
                          fields=None, additional_fields=[], m2m_fields={},
-                         exclude=None, header=True):
+                         exclude=None, header=True, stream=False,
+                         chunk_size=None, background=False, workers=None,
+                         incremental=None):
     """
     This function returns an export csv action
     'fields' and 'exclude' work like in django ModelForm
     'header' is whether or not to output the column names as the first row
+    'stream' sends rows to the client as they are written using a
+    `StreamingHttpResponse`, reading the queryset in primary key order
+    'chunk_size' rows at a time, so memory use doesn't grow with the export
+    'background' queues the export as an `ExportJob` instead of building it
+    during the request (see `queue_export_job`)
+    'workers' renders a streamed export in that many processes, one primary
+    key range each (defaults to `settings.EXPORT_WORKERS`, see
+    `sharded_export`); only used with 'stream', since shards are in primary
+    key order rather than the queryset's
+    'incremental' names an export checkpoint; only rows created or updated
+    since the last export under that name are included, from the whole table
+    rather than the selected rows (models using `CreatedMixin` only, see
+    `ExportPlan.rows`)
     """
+    plan_kwargs = dict(fields=fields, additional_fields=additional_fields,
+                       m2m_fields=m2m_fields, exclude=exclude)
 
     def export_as_csv(modeladmin, request, queryset):
         """
         Generic csv export admin action.
         based on http://djangosnippets.org/snippets/1697/
         """
-        opts = modeladmin.model._meta
-        if fields:
-            fieldset = set(fields)
-            field_names = fields
+        if background:
+            return queue_export_job(modeladmin, request, queryset, filename,
+                                    'csv', plan_kwargs, header, chunk_size,
+                                    incremental)
+
+        plan = ExportPlan(modeladmin.model, **plan_kwargs)
+        shards = None
+        if stream and incremental is None:
+            shards = sharded_export(queryset, 'csv', plan_kwargs, workers, chunk_size)
+
+        if shards is not None:
+            writer = csv.writer(Echo())
+            content = _read_shard_bytes(shards)
+            if header:
+                content = itertools.chain([writer.writerow(plan.header())], content)
+            response = StreamingHttpResponse(content, content_type='text/csv')
+        elif stream:
+            writer = csv.writer(Echo())
+            rows = plan.rows(queryset, header, stream, chunk_size, incremental)
+            response = StreamingHttpResponse(
+                (writer.writerow(row) for row in rows),
+                content_type='text/csv')
         else:
-            field_names = set([field.name for field in opts.fields])
+            response = HttpResponse(content_type='text/csv')
+            writer = csv.writer(response)
+            for row in plan.rows(queryset, header, stream, chunk_size, incremental):
+                writer.writerow(row)
+
+        response['Content-Disposition'] = 'attachment; filename=%s' % filename
+        return response
+
+    export_as_csv.short_description = description
+    return export_as_csv
 
-            if exclude:
-                excludeset = set(exclude)
-                field_names = field_names - excludeset
 
-        response = HttpResponse(content_type='text/csv')
+def export_as_ndjson_action(filename, description="Export as JSON Lines",
+                            fields=None, additional_fields=[], m2m_fields={},
+                            exclude=None, chunk_size=None, background=False,
+                            incremental=None):
+    """
+    This function returns an export JSON Lines action
+    'fields' and 'exclude' work like in django ModelForm
+    'background' queues the export as an `ExportJob` instead of building it
+    during the request (see `queue_export_job`)
+    'incremental' names an export checkpoint; only rows created or updated
+    since the last export under that name are included, from the whole table
+    rather than the selected rows (models using `CreatedMixin` only, see
+    `ExportPlan.rows`)
+
+    Each row is streamed as a JSON object keyed by column name, reading the
+    queryset in primary key order 'chunk_size' rows at a time. Integers,
+    floats, booleans and nulls keep their JSON types; decimals (e.g.
+    `DecimalField` values) are exact strings and dates are ISO 8601 strings.
+    """
+    plan_kwargs = dict(fields=fields, additional_fields=additional_fields,
+                       m2m_fields=m2m_fields, exclude=exclude)
+
+    def export_as_ndjson(modeladmin, request, queryset):
+        if background:
+            return queue_export_job(modeladmin, request, queryset, filename,
+                                    'ndjson', plan_kwargs, True, chunk_size,
+                                    incremental)
+
+        plan = ExportPlan(modeladmin.model, convert=json_field, **plan_kwargs)
+        rows = plan.rows(queryset, True, stream=True, chunk_size=chunk_size,
+                         checkpoint=incremental)
+
+        response = StreamingHttpResponse(ndjson_lines(rows),
+                                         content_type='application/x-ndjson')
         response['Content-Disposition'] = 'attachment; filename=%s' % filename
+        return response
 
-        m2m_field_names = map(operator.itemgetter("name"), m2m_fields)
-        m2m_field_groups = map(operator.itemgetter("group_by_name"), m2m_fields)
-        m2m_field_group_models = map(operator.itemgetter("group_by_model"), m2m_fields)
+    export_as_ndjson.short_description = description
+    return export_as_ndjson
 
-        m2m_instances_to_field_names = {}
-        for field_name, group_name, Model in zip(m2m_field_names, m2m_field_groups, m2m_field_group_models):
-            for instance in Model.objects.all():
-                m2m_instances_to_field_names[instance] = (field_name, group_name)
+def export_as_parquet_action(filename, description="Export as Parquet",
+                             fields=None, additional_fields=[], m2m_fields={},
+                             exclude=None, chunk_size=None, incremental=None):
+    """
+    This function returns an export Parquet action
+    'fields' and 'exclude' work like in django ModelForm
+    'incremental' names an export checkpoint; only rows created or updated
+    since the last export under that name are included, from the whole table
+    rather than the selected rows (models using `CreatedMixin` only, see
+    `ExportPlan.rows`)
 
-        m2m_instances = m2m_instances_to_field_names.keys()
+    The queryset is read in primary key order and written one row group per
+    'chunk_size' rows to a temporary file, so memory use stays bounded.
+    Model fields are stored in typed columns (see `parquet_schema`).
+    """
+    plan_kwargs = dict(fields=fields, additional_fields=additional_fields,
+                       m2m_fields=m2m_fields, exclude=exclude)
 
-        writer = csv.writer(response)
-        if header:
-            row = []
-            for field_name in field_names:
-                row.append(field_name)
+    def export_as_parquet(modeladmin, request, queryset):
+        plan = ExportPlan(modeladmin.model, convert=parquet_field, **plan_kwargs)
+        schema = parquet_schema(plan)
+        rows = plan.rows(queryset, False, stream=True, chunk_size=chunk_size,
+                         checkpoint=incremental)
 
-            for field_name in additional_fields:
-                row.append(field_name)
+        output = tempfile.TemporaryFile()
+        write_parquet(output, rows, schema, chunk_size)
+        return _file_response(output, 'application/vnd.apache.parquet', filename)
 
-            for instance in m2m_instances:
-                row.append(unicode(instance))
+    export_as_parquet.short_description = description
+    return export_as_parquet
 
-            writer.writerow(row)
+if settings.EXPORT_JOBS_ENABLED:
+    from lionheart.models import ExportJob
 
-        for obj in queryset:
-            row = []
-            for field_name in field_names:
-                row.append(handle_field(operator.attrgetter(field_name)(obj)))
+    class ExportJobAdmin(admin.ModelAdmin):
+        """
+        Lists background export jobs with their progress and a download link
+        once they've finished.
+        """
+        list_display = ('filename', 'status', 'progress_display', 'created_on',
+                        'download_link')
+        list_filter = ('status',)
+        readonly_fields = ('filename', 'format', 'status', 'rows_total',
+                           'rows_written', 'progress_display', 'download_link',
+                           'error')
+        exclude = ('file',)
 
-            for field_name in additional_fields:
-                row.append(handle_field(operator.attrgetter(field_name)(obj)))
+        def has_add_permission(self, request):
+            return False
 
-            for instance, (field_name, group_name) in m2m_instances_to_field_names.items():
-                field = operator.attrgetter(field_name)(obj)
-                queryset = field.filter(**{group_name: instance})
-                value = ", ".join(map(str, queryset))
-                row.append(value)
+        def progress_display(self, obj):
+            progress = obj.progress
+            if progress is None:
+                return "-"
+            return "{}%".format(progress)
+        progress_display.short_description = "Progress"
 
-            writer.writerow(row)
-        return response
+        def download_link(self, obj):
+            if obj.status == ExportJob.DONE and obj.file:
+                return format_html('<a href="{}">Download</a>',
+                        reverse('admin:lionheart_exportjob_download', args=(obj.pk,)))
+            return "-"
+        download_link.short_description = "Download"
 
-    export_as_csv.short_description = description
-    return export_as_csv
+        def get_urls(self):
+            return [
+                url(r'^(?P<pk>\d+)/download/$',
+                    self.admin_site.admin_view(self.download_view),
+                    name='lionheart_exportjob_download'),
+            ] + super(ExportJobAdmin, self).get_urls()
+
+        def download_view(self, request, pk):
+            """
+            Streams a finished export to staff with permission to view export
+            jobs. Downloads go through here rather than `file.url`, since
+            exports are full data dumps and the storage may be public.
+            """
+            if hasattr(self, 'has_view_permission'):
+                allowed = self.has_view_permission(request)
+            else:
+                # Django < 2.1
+                allowed = self.has_change_permission(request)
+            if not allowed:
+                raise PermissionDenied
+
+            try:
+                job = ExportJob.objects.get(pk=pk, status=ExportJob.DONE)
+            except ExportJob.DoesNotExist:
+                raise Http404("Export not found.")
+            if not job.file:
+                raise Http404("Export not found.")
+
+            job.file.open('rb')
+            response = StreamingHttpResponse(FileWrapper(job.file),
+                    content_type=EXPORT_FORMATS.get(job.format, (None, None,
+                        'application/octet-stream'))[2])
+            response['Content-Length'] = job.file.size
+            response['Content-Disposition'] = 'attachment; filename=%s' % job.filename
+            return response
+
+    admin.site.register(ExportJob, ExportJobAdmin)
@@ -12,14 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import logging
 from functools import wraps
 
 import django
+from django.db import transaction
 from django.shortcuts import render as django_render
 from django.http import HttpResponseRedirect
 from django.template import loader as template_loader
 
+from lionheart.redirects import RedirectTrackingMixin
+from lionheart.redirects import get_changed_path
+from lionheart.redirects import update_redirects
 from lionheart.utils import JSONResponse
 from lionheart import forms
 from lionheart import settings
@@ -188,54 +193,27 @@ def formify(form_obj, url='/', save=False, tipsy_errors=False):
 
 
 def create_redirect_if_required(fun):
+    """
+    Decorator for a model's `save` method that creates a redirect from the
+    instance's previous `get_absolute_url()` to its new one when it changes.
+
+    This compares with a fresh copy of the row on every save; models that use
+    `lionheart.redirects.RedirectTrackingMixin` do the same from an in-memory
+    snapshot instead, and don't need this decorator.
+    """
     @functools.wraps(fun)
     def inner(self, *args, **kwargs):
-        Model = self.__class__
-
-        # Compare previous slug with new slug.
-        try:
-            unchanged_self = Model.objects.get(id=self.id)
-        except Model.DoesNotExist:
-            # There is no previous instance of the object, so we don't need to
-            # do anything.
-            pass
-        else:
-            old_path = unchanged_self.get_absolute_url()
-            new_path = self.get_absolute_url()
-
-            if old_path != new_path:
-                # If the URL has changed, set up a redirect.
-                with transaction.atomic():
-                    # Update all relevant redirects to point towards the
-                    # updated new_path.
-                    previous_redirects = redirect_models.Redirect.objects \
-                            .filter(new_path=old_path)
-                    previous_redirects.update(new_path=new_path)
-
-                    # If new_path is an existing old_path in another Redirect
-                    # object, we delete that previous object to avoid a
-                    # redirect loop.
-                    redirect_models.Redirect.objects \
-                            .filter(old_path=new_path) \
-                            .delete()
-
-                    params = {
-                        'site_id': 1,
-                        'old_path': old_path,
-                        'new_path': new_path
-                    }
-
-                    try:
-                        redirect_models.Redirect.objects.create(**params)
-                    except IntegrityError:
-                        pass
-
-                    fun(self, *args, **kwargs)
-
-                    # We return here so that the super call to save below does
-                    # not get called.
-                    return
-
-        fun(self, *args, **kwargs)
+        if isinstance(self, RedirectTrackingMixin):
+            # The mixin's save takes care of it.
+            return fun(self, *args, **kwargs)
+
+        paths = get_changed_path(self)
+        if paths is None:
+            return fun(self, *args, **kwargs)
+
+        # If the URL has changed, set up a redirect.
+        with transaction.atomic():
+            update_redirects(*paths)
+            return fun(self, *args, **kwargs)
 
     return inner
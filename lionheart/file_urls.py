@@ -0,0 +1,27 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    from django.conf.urls import url
+except ImportError:
+    from django.urls import re_path as url
+
+from lionheart.file_views import serve_file
+
+# Every stored file is served to anyone who requests it by name, unless
+# settings.DATABASE_STORAGE_ACCESS_CHECK is set (see `serve_file`).
+
+urlpatterns = [
+    url(r'^(?P<name>.+)$', serve_file, name='lionheart-file'),
+]
@@ -0,0 +1,205 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import calendar
+import posixpath
+import re
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    # Python 2
+    from urllib import quote
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.http import http_date
+from django.utils.http import parse_http_date_safe
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_http_methods
+
+from lionheart import settings
+
+range_header = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$')
+etag_header = re.compile(r'\s*((?:W/)?"[^"]*"|\*)\s*(?:,|$)')
+
+def _parse_etags(header):
+    return [etag[2:] if etag.startswith('W/') else etag
+            for etag in etag_header.findall(header)]
+
+def _parse_range(header, size):
+    """
+    Returns the `(start, end)` byte positions (inclusive) requested by a
+    single-range `Range` header, `None` if the header should be ignored, or
+    `False` if the range can't be satisfied.
+    """
+    match = range_header.match(header)
+    if match is None:
+        # Malformed and multi-range requests are answered with the whole file.
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # A suffix range: the last `last` bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def _is_inline_type(mime_type):
+    return mime_type is not None \
+            and mime_type.startswith(tuple(settings.DATABASE_STORAGE_INLINE_TYPES))
+
+def _attachment_header(name):
+    filename = posixpath.basename(name)
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        return "attachment; filename*=UTF-8''{}".format(quote(filename.encode('utf-8')))
+    return 'attachment; filename="{}"'.format(
+            filename.replace('\\', '\\\\').replace('"', '\\"'))
+
+def _stream(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(settings.DATABASE_STORAGE_CHUNK_SIZE, length))
+            if not data:
+                break
+
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_file(request, name, storage=None, access_check=None):
+    """
+    Serves a file from one of the database storages (`default_storage`
+    unless `storage` is given), streaming it from the database.
+
+    Responses carry a strong `ETag` (the file's SHA-256 digest, or for
+    `Base64DatabaseStorage` the id and size of its row) and, where the storage
+    records it, `Last-Modified`. Conditional requests are
+    answered with 304 Not Modified, and single `Range` requests (including
+    `If-Range`) with 206 Partial Content.
+
+    Without an `access_check` (or `settings.DATABASE_STORAGE_ACCESS_CHECK`),
+    every file is public to anyone who knows its name. The check is called
+    with the request and the file name, and a false result is answered with
+    403 Forbidden. Since uploads are served from the site's own origin, only
+    the types in `settings.DATABASE_STORAGE_INLINE_TYPES` are shown inline;
+    anything else, e.g. HTML or SVG that could run script, is sent as an
+    attachment under `Content-Security-Policy: sandbox`, and MIME sniffing is
+    always disabled.
+
+        url(r'^files/', include('lionheart.file_urls'))
+    """
+    if storage is None:
+        storage = default_storage
+
+    if access_check is None and settings.DATABASE_STORAGE_ACCESS_CHECK is not None:
+        access_check = import_string(settings.DATABASE_STORAGE_ACCESS_CHECK)
+    if access_check is not None and not access_check(request, name):
+        raise PermissionDenied
+
+    try:
+        metadata = storage.metadata(name)
+        etag = '"{}"'.format(storage.etag(name))
+    except ObjectDoesNotExist:
+        raise Http404("File not found.")
+
+    size = metadata['size']
+    modified_time = metadata['modified_time']
+    last_modified = None
+    if modified_time is not None:
+        last_modified = calendar.timegm(modified_time.utctimetuple())
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_none_match is not None:
+        etags = _parse_etags(if_none_match)
+        not_modified = '*' in etags or etag in etags
+    elif if_modified_since is not None and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        not_modified = since is not None and last_modified <= since
+    else:
+        not_modified = False
+
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'X-Content-Type-Options': 'nosniff' }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+
+    if not_modified:
+        response = HttpResponse(status=304)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    range_value = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_value is not None:
+        if if_range is None or if_range.strip() == etag \
+                or (last_modified is not None
+                    and parse_http_date_safe(if_range) == last_modified):
+            byte_range = _parse_range(range_value, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    if byte_range is None:
+        start, length, status = 0, size, 200
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        status = 206
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(status=status)
+    else:
+        response = StreamingHttpResponse(
+                _stream(storage.open(name), start, length), status=status)
+
+    mime_type = metadata['mime_type']
+    response['Content-Type'] = mime_type or 'application/octet-stream'
+    response['Content-Length'] = str(length)
+    if not _is_inline_type(mime_type):
+        response['Content-Disposition'] = _attachment_header(name)
+        response['Content-Security-Policy'] = 'sandbox'
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -0,0 +1,91 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.module_loading import import_string
+
+from lionheart.storages import copy_files
+from lionheart.storages import walk_files
+
+def get_storage(path, location=None):
+    if path == 'default':
+        return default_storage
+
+    kwargs = {}
+    if location is not None:
+        kwargs['location'] = location
+    return import_string(path)(**kwargs)
+
+class Command(BaseCommand):
+    help = "Copies every file from one storage to another, e.g. from " \
+            "lionheart.storages.Base64DatabaseStorage to " \
+            "django.core.files.storage.FileSystemStorage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('source',
+                help="Dotted path of the storage class to copy from, or 'default'.")
+        parser.add_argument('destination',
+                help="Dotted path of the storage class to copy to, or 'default'.")
+        parser.add_argument('--source-location',
+                help="`location` passed to the source storage (for FileSystemStorage).")
+        parser.add_argument('--destination-location',
+                help="`location` passed to the destination storage.")
+        parser.add_argument('--path', default='',
+                help="Only copy files under this directory.")
+        parser.add_argument('--workers', type=int, default=4,
+                help="Number of files to copy at once (use 1 with SQLite, which allows one writer).")
+        parser.add_argument('--checkpoint',
+                help="File recording the copied names, used to resume an interrupted copy.")
+        parser.add_argument('--overwrite', action='store_true',
+                help="Replace files that already exist in the destination.")
+        parser.add_argument('--no-verify', action='store_false', dest='verify',
+                help="Don't read copies back to compare checksums.")
+        parser.add_argument('--report-every', type=int, default=100,
+                help="Print progress every this many files.")
+
+    def handle(self, *args, **options):
+        source = get_storage(options['source'], options['source_location'])
+        destination = get_storage(options['destination'],
+                options['destination_location'])
+        report_every = options['report_every']
+
+        def progress(stats):
+            processed = stats['copied'] + stats['skipped'] + stats['failed']
+            if report_every and processed % report_every == 0:
+                self.stdout.write(self.format_stats(stats))
+
+        stats = copy_files(source, destination,
+                names=walk_files(source, options['path']),
+                workers=options['workers'],
+                checkpoint=options['checkpoint'],
+                overwrite=options['overwrite'],
+                verify=options['verify'],
+                progress=progress)
+
+        for name, error in sorted(stats['errors'].items()):
+            self.stderr.write("{}: {}".format(name, error))
+
+        self.stdout.write(self.format_stats(stats))
+        if stats['failed']:
+            raise CommandError("{} files failed to copy.".format(stats['failed']))
+
+    def format_stats(self, stats):
+        seconds = max(stats['seconds'], 1e-6)
+        return "Copied {} files ({:.1f} MB), skipped {}, failed {} in {:.1f}s " \
+                "({:.1f} files/s, {:.2f} MB/s).".format(
+                        stats['copied'], stats['bytes'] / 1e6, stats['skipped'],
+                        stats['failed'], stats['seconds'],
+                        stats['copied'] / seconds, stats['bytes'] / 1e6 / seconds)
@@ -0,0 +1,30 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.management.base import BaseCommand
+
+from lionheart.storages import migrate_base64_files
+
+class Command(BaseCommand):
+    help = "Copies files stored by Base64DatabaseStorage into BinaryDatabaseStorage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                help="Number of files to copy per transaction.")
+        parser.add_argument('--delete', action='store_true',
+                help="Delete the base64 copies once they've been migrated.")
+
+    def handle(self, *args, **options):
+        copied = migrate_base64_files(options['batch_size'], options['delete'])
+        self.stdout.write("Copied {} files.".format(copied))
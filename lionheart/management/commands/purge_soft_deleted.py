@@ -0,0 +1,69 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from lionheart.models import SoftDeleteMixin
+from lionheart.models import purge_soft_deleted
+
+class Command(BaseCommand):
+    help = "Permanently deletes soft-deleted rows in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.Model',
+                help="Models to purge (default: every SoftDeleteMixin model).")
+        parser.add_argument('--batch-size', type=int,
+                help="Number of rows to delete per transaction.")
+        parser.add_argument('--min-age-days', type=float,
+                help="Only purge rows deleted at least this many days ago.")
+        parser.add_argument('--sleep', type=float, default=0,
+                help="Seconds to pause between batches.")
+
+    def handle(self, *args, **options):
+        if options['models']:
+            try:
+                models = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+        else:
+            models = [model for model in apps.get_models()
+                      if issubclass(model, SoftDeleteMixin)]
+
+        min_age = None
+        if options['min_age_days'] is not None:
+            min_age = datetime.timedelta(days=options['min_age_days'])
+
+        for model in models:
+            if not issubclass(model, SoftDeleteMixin):
+                raise CommandError("{} doesn't use SoftDeleteMixin.".format(
+                    model._meta.label))
+
+            start = time.time()
+
+            def progress(purged):
+                self.stdout.write("{}: purged {} rows ({:.0f} rows/s)".format(
+                    model._meta.label, purged, purged / max(time.time() - start, 1e-6)))
+
+            purged = purge_soft_deleted(model,
+                    batch_size=options['batch_size'],
+                    min_age=min_age,
+                    sleep=options['sleep'],
+                    progress=progress)
+            self.stdout.write("{}: done, purged {} rows in {:.1f}s.".format(
+                model._meta.label, purged, time.time() - start))
@@ -0,0 +1,70 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.conf import settings as django_settings
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.http import HttpResponseGone
+from django.http import HttpResponsePermanentRedirect
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    # Django < 1.10
+    MiddlewareMixin = object
+
+from lionheart.redirects import redirect_table
+
+class RedirectMiddleware(MiddlewareMixin):
+    """
+    Serves the redirects from `django.contrib.redirects` for responses that
+    would otherwise be a 404, like `RedirectFallbackMiddleware`, but from an
+    in-memory table (see `lionheart.redirects.RedirectTable`) instead of a
+    query per request. Chains of redirects are followed to their end in one
+    step.
+
+    The table is reloaded after `create_redirect_if_required` or
+    `RedirectTrackingMixin` write redirects, and whenever a `Redirect` is
+    saved or deleted. `RedirectMiddleware.stats()` returns the hit, miss
+    and reload counters of the current process.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RedirectMiddleware, self).__init__(*args, **kwargs)
+
+        from django.contrib.redirects.models import Redirect
+        post_save.connect(redirect_table.invalidate, sender=Redirect,
+                dispatch_uid='lionheart.middleware.RedirectMiddleware')
+        post_delete.connect(redirect_table.invalidate, sender=Redirect,
+                dispatch_uid='lionheart.middleware.RedirectMiddleware')
+
+    @staticmethod
+    def stats():
+        return redirect_table.stats()
+
+    def process_response(self, request, response):
+        if response.status_code != 404:
+            return response
+
+        full_path = request.get_full_path()
+        new_path = redirect_table.resolve(full_path)
+        if new_path is None and getattr(django_settings, 'APPEND_SLASH', True) \
+                and not request.path.endswith('/'):
+            path, separator, query = full_path.partition('?')
+            new_path = redirect_table.resolve(path + '/' + separator + query)
+
+        if new_path is None:
+            return response
+        if new_path == '':
+            return HttpResponseGone()
+        return HttpResponsePermanentRedirect(new_path)
@@ -12,16 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from hashlib import md5
+import copy
+import datetime
+import numbers
 import random
 import re
+import time
+import uuid
+import zlib
 
 from django.core.mail import EmailMultiAlternatives
+from django.db import connections
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.utils import timezone
 from django.template.loader import render_to_string
 
-import settings
+from lionheart import settings
 from django.conf import settings as django_settings
+from lionheart.utils import LRUCache
+from lionheart.utils import get_cache
 
 
 class OptionalCharField(models.CharField):
@@ -46,6 +62,20 @@ class OptionalEmailField(models.EmailField):
         super(OptionalEmailField, self).__init__(*args, **kwargs)
 
 
+class PositionField(models.IntegerField):
+    """
+    Integer field for `Orderable.position`. Rows saved through `save()`
+    without a position are appended there; rows that skip `save()`, e.g. in
+    `bulk_create`, get 0 here instead of violating the NOT NULL constraint.
+    """
+    def pre_save(self, model_instance, add):
+        value = super(PositionField, self).pre_save(model_instance, add)
+        if value is None:
+            value = 0
+            setattr(model_instance, self.attname, value)
+        return value
+
+
 class CreatedMixin(models.Model):
     """
     Abstract model mixin that adds `created_on` and `updated_on` fields to
@@ -58,6 +88,108 @@ class CreatedMixin(models.Model):
         abstract = True
 
 
+class DirtyFieldsMixin(models.Model):
+    """
+    Abstract model mixin that remembers the values of an instance's fields
+    when it's loaded and saves only the ones that changed since, by passing
+    `update_fields` (plus any `auto_now` fields, such as `updated_on` from
+    `CreatedMixin`). Saving an instance with no changes doesn't write at all.
+
+    List it before the other mixins so its `save` runs first:
+
+        class Invoice(DirtyFieldsMixin, CreatedMixin, SoftDeleteMixin):
+            ...
+    """
+    class Meta():
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DirtyFieldsMixin, cls).from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    def snapshot_fields(self):
+        """
+        Records the current value of every loaded field as its original value.
+        """
+        original_values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                if isinstance(value, (dict, list)):
+                    value = copy.deepcopy(value)
+                original_values[field.attname] = value
+        self._original_values = original_values
+
+    def get_dirty_fields(self):
+        """
+        Returns the names of the fields that changed since the instance was
+        loaded or last saved.
+        """
+        original_values = getattr(self, '_original_values', None)
+        if original_values is None:
+            return [field.name for field in self._meta.concrete_fields]
+
+        dirty_fields = []
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                # Deferred and never set.
+                continue
+            if field.attname not in original_values \
+                    or self.__dict__[field.attname] != original_values[field.attname]:
+                dirty_fields.append(field.name)
+        return dirty_fields
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(DirtyFieldsMixin, self).refresh_from_db(using=using,
+                fields=fields, **kwargs)
+        original_values = getattr(self, '_original_values', None)
+        if fields is None or original_values is None:
+            self.snapshot_fields()
+            return
+
+        # Only the given fields were reloaded (e.g. a deferred field on first
+        # access), so the other fields keep their original values.
+        fields = set(fields)
+        for field in self._meta.concrete_fields:
+            if (field.name in fields or field.attname in fields) \
+                    and field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                if isinstance(value, (dict, list)):
+                    value = copy.deepcopy(value)
+                original_values[field.attname] = value
+
+    def _is_snapshot_row(self):
+        # Setting the primary key to None (or another value) is how
+        # instances are copied, and such a save mustn't be an update of the
+        # snapshotted row's changed fields.
+        original_values = getattr(self, '_original_values', None)
+        pk_attname = self._meta.pk.attname
+        return original_values is not None \
+                and self.pk is not None \
+                and pk_attname in original_values \
+                and original_values[pk_attname] == self.pk
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding \
+                and self._is_snapshot_row() \
+                and not args \
+                and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            dirty_fields = self.get_dirty_fields()
+            if not dirty_fields:
+                return
+
+            auto_now_fields = [field.name for field in self._meta.concrete_fields
+                               if getattr(field, 'auto_now', False)
+                               and field.name not in dirty_fields]
+            kwargs['update_fields'] = dirty_fields + auto_now_fields
+
+        super(DirtyFieldsMixin, self).save(*args, **kwargs)
+        self.snapshot_fields()
+
+
 def PasswordResetMixin(template="emails/password_reset.txt",
         subject="Reset your password",
         sender="notifications@elmcitylabs.com",
@@ -128,7 +260,83 @@ def formatted_total(instance, Model, key, prefix="formatted_"):
         return super(Model, instance).__getattribute__(key)
 
 
-if django_settings.DEFAULT_FILE_STORAGE.endswith('Base64DatabaseStorage'):
+def format_currency(value, format="${:,.2f}", empty="-"):
+    """
+    Formats `value` as currency, or returns `empty` if it's `None`.
+    """
+    if value is None:
+        return empty
+    return format.format(value)
+
+
+class FormattedField(object):
+    """
+    Descriptor that returns the value of `field_name` formatted with
+    `format_currency`.
+    """
+    def __init__(self, field_name, format="${:,.2f}", empty="-"):
+        self.field_name = field_name
+        self.format = format
+        self.empty = empty
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return format_currency(getattr(instance, self.field_name),
+                self.format, self.empty)
+
+
+class FormattedFields(object):
+    """
+    Adds a read-only `formatted_<field>` attribute to a model for each of the
+    given fields, as a descriptor created along with the model class. Unlike
+    overriding `__getattribute__` with `formatted_total`, other attribute
+    lookups don't pay for it.
+
+        class Order(models.Model):
+            total = models.DecimalField(max_digits=10, decimal_places=2)
+            tax = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+
+            formatted = FormattedFields('total', 'tax')
+
+        order.formatted_total  # "$1,234.50"
+
+    :param format: the format string applied to each value
+    :type format: str
+
+    :param empty: what to return for `None`
+    :type empty: str
+
+    :param prefix: the prefix of the generated attribute names
+    :type prefix: str
+    """
+    def __init__(self, *field_names, **kwargs):
+        self.field_names = field_names
+        self.format = kwargs.get('format', "${:,.2f}")
+        self.empty = kwargs.get('empty', "-")
+        self.prefix = kwargs.get('prefix', "formatted_")
+
+    def contribute_to_class(self, cls, name):
+        for field_name in self.field_names:
+            setattr(cls, self.prefix + field_name,
+                    FormattedField(field_name, self.format, self.empty))
+
+
+def format_column(queryset, field_name, format="${:,.2f}", empty="-"):
+    """
+    Formats one column of `queryset` with `format_currency`, fetching only the
+    primary key and that column in a single query. Returns an ordered
+    dictionary mapping each primary key to its formatted value.
+    """
+    format_value = format.format
+    formatted = OrderedDict()
+    for pk, value in queryset.values_list('pk', field_name).iterator():
+        formatted[pk] = empty if value is None else format_value(value)
+    return formatted
+
+
+if django_settings.DEFAULT_FILE_STORAGE.endswith(('Base64DatabaseStorage',
+        'BinaryDatabaseStorage', 'DeduplicatingDatabaseStorage')):
     class UploadedFile(models.Model):
         filename = models.CharField(max_length=100)
         blob = models.TextField()
@@ -136,30 +344,336 @@ if django_settings.DEFAULT_FILE_STORAGE.endswith('Base64DatabaseStorage'):
 
         def __unicode__(self):
             return self.filename
+
+    class BinaryUploadedFile(CreatedMixin):
+        """
+        A file stored by `BinaryDatabaseStorage`, kept as raw bytes. Files no
+        larger than one chunk are stored inline in `data` (with a `chunk_size`
+        of 0), larger ones as `BinaryUploadedFileChunk` rows of `chunk_size`
+        bytes each.
+
+        If `codec` is set, the stored bytes are compressed with it and
+        `compressed_size` is their length; `size` and `digest` always describe
+        the original content.
+        """
+        filename = models.CharField(max_length=255, unique=True)
+        data = models.BinaryField()
+        size = models.BigIntegerField()
+        chunk_size = models.IntegerField(default=0)
+        digest = models.CharField(max_length=64, blank=True, db_index=True)
+        codec = models.CharField(max_length=16, blank=True, default='')
+        compressed_size = models.BigIntegerField(null=True, blank=True)
+
+        def __unicode__(self):
+            return self.filename
+
+    class BinaryUploadedFileChunk(models.Model):
+        file = models.ForeignKey(BinaryUploadedFile, related_name='chunks',
+                on_delete=models.CASCADE)
+        index = models.IntegerField()
+        data = models.BinaryField()
+
+        class Meta:
+            unique_together = (('file', 'index'),)
+
+    class FileReference(CreatedMixin):
+        """
+        A name stored by `DeduplicatingDatabaseStorage`, pointing to content
+        shared by every name with the same digest.
+        """
+        name = models.CharField(max_length=255, unique=True)
+        file = models.ForeignKey(BinaryUploadedFile, related_name='references',
+                on_delete=models.PROTECT)
+
+        def __unicode__(self):
+            return self.name
 else:
     class UploadedFile():
         pass
 
+    class BinaryUploadedFile():
+        pass
+
+    class BinaryUploadedFileChunk():
+        pass
+
+    class FileReference():
+        pass
+
+
+if settings.EXPORT_JOBS_ENABLED:
+    class ExportJob(CreatedMixin):
+        """
+        A queued admin export, written to `file` in the background by the
+        export actions' job mode.
+        """
+        PENDING = 0
+        RUNNING = 1
+        DONE = 2
+        FAILED = 3
+
+        STATUS_CHOICES = (
+            (PENDING, "pending"),
+            (RUNNING, "running"),
+            (DONE, "done"),
+            (FAILED, "failed"),
+        )
+
+        filename = models.CharField(max_length=255)
+        format = models.CharField(max_length=10)
+        status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+        rows_total = models.BigIntegerField(null=True, blank=True)
+        rows_written = models.BigIntegerField(default=0)
+        file = models.FileField(upload_to=settings.EXPORT_JOB_UPLOAD_TO,
+                max_length=255, null=True, blank=True)
+        error = models.TextField(blank=True)
+
+        class Meta:
+            ordering = ('-created_on',)
+
+        def __unicode__(self):
+            return self.filename
+
+        @property
+        def progress(self):
+            """
+            Percentage of rows written so far, or `None` if the total isn't
+            known yet.
+            """
+            if self.status == self.DONE:
+                return 100
+            elif not self.rows_total:
+                return None
+            return min(100, self.rows_written * 100 // self.rows_total)
+else:
+    class ExportJob():
+        pass
+
+
+if settings.EXPORT_CHECKPOINTS_ENABLED:
+    class ExportCheckpoint(models.Model):
+        """
+        The `(updated_on, pk)` key of the last row sent by an incremental
+        admin export, stored per export name.
+        """
+        name = models.CharField(max_length=255, unique=True)
+        updated_on = models.DateTimeField()
+        last_pk = models.CharField(max_length=255)
+        exported_on = models.DateTimeField(auto_now=True)
+
+        def __unicode__(self):
+            return self.name
+else:
+    class ExportCheckpoint():
+        pass
+
 
 class Orderable(models.Model):
-    position = models.IntegerField(default=0)
+    """
+    Abstract model mixin that keeps rows in a user-defined order.
+
+    Positions are integers spaced `position_gap` apart, so moving a row
+    (`move_before`, `move_after`, `move_to`) normally updates only that row,
+    to a position between its new neighbours. When two neighbours have no
+    room left between them, the rows are renumbered first (`rebalance`).
+
+    Set `position_scope` to a tuple of field names to keep a separate order
+    per value of those fields (e.g. per list).
+
+    Appends and moves hold a lock on the row's scope until the transaction
+    ends (see `_lock_position_scope`), so concurrent appends get distinct
+    positions.
+
+    `bulk_create` doesn't call `save()`, so rows created that way without a
+    position all get position 0 (see `PositionField`). Give them positions
+    yourself, or call `reorder` afterwards.
+    """
+    position = PositionField(blank=True)
+
+    position_gap = 1024
+    position_scope = ()
 
     class Meta():
         abstract = True
-        ordering = ('position',)
+        ordering = ('position', 'pk')
+
+    def _position_queryset(self):
+        queryset = self.__class__._base_manager.all()
+        for field in self.position_scope:
+            queryset = queryset.filter(**{field: getattr(self, field)})
+        return queryset
+
+    def _lock_position_scope(self):
+        """
+        Blocks until no other transaction is appending to or moving rows in
+        this row's scope, and keeps others out until the current transaction
+        ends. Must be called inside `transaction.atomic()`.
+
+        PostgreSQL takes a transaction-level advisory lock for the scope,
+        which works even while the scope has no rows. SQLite locks the whole
+        database for writing. Other databases rely on the `SELECT ... FOR
+        UPDATE` of the last row in `save`, which can't lock an empty scope;
+        there, concurrent first appends may deadlock and fail instead.
+        """
+        using = router.db_for_write(self.__class__, instance=self)
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            scope = [self._meta.db_table]
+            scope.extend(str(getattr(self, field)) for field in self.position_scope)
+            key = zlib.crc32(':'.join(scope).encode('utf-8')) & 0xffffffff
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+        elif connection.vendor == 'sqlite':
+            # Any write, even one matching no rows, takes the write lock.
+            table = connection.ops.quote_name(self._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                        'UPDATE {} SET position = position WHERE 0 = 1'.format(table))
 
     def save(self, *args, **kwargs):
-        model = self.__class__
-
         if self.position is None:
-            first = model.objects.order_by('-position').first()
-            if first is None:
-                self.position = 0
-            else:
-                self.position = first.position + 1
+            with transaction.atomic():
+                self._lock_position_scope()
+                # Read the last position only once the lock is held, so a
+                # row appended by the transaction we waited for is seen.
+                last = self._position_queryset() \
+                        .select_for_update() \
+                        .order_by('-position') \
+                        .values_list('position', flat=True) \
+                        .first()
+                if last is None:
+                    self.position = 0
+                else:
+                    self.position = last + self.position_gap
+
+                return super(Orderable, self).save(*args, **kwargs)
 
         return super(Orderable, self).save(*args, **kwargs)
 
+    def _set_position(self, position):
+        self.__class__._base_manager \
+                .filter(pk=self.pk) \
+                .update(position=position)
+        self.position = position
+
+    def _move_between(self, get_neighbours):
+        with transaction.atomic():
+            self._lock_position_scope()
+            before, after = get_neighbours()
+            if before is not None and after is not None and after - before < 2:
+                self.rebalance()
+                before, after = get_neighbours()
+
+            if before is None and after is None:
+                position = 0
+            elif before is None:
+                position = after - self.position_gap
+            elif after is None:
+                position = before + self.position_gap
+            else:
+                position = (before + after) // 2
+            self._set_position(position)
+
+    def _others(self):
+        return self._position_queryset() \
+                .exclude(pk=self.pk) \
+                .select_for_update()
+
+    def move_before(self, other):
+        """
+        Moves this row to just before `other`.
+        """
+        def get_neighbours():
+            other.position = self.__class__._base_manager \
+                    .values_list('position', flat=True) \
+                    .get(pk=other.pk)
+            before = self._others() \
+                    .filter(models.Q(position__lt=other.position)
+                            | models.Q(position=other.position, pk__lt=other.pk)) \
+                    .order_by('-position', '-pk') \
+                    .values_list('position', flat=True) \
+                    .first()
+            return before, other.position
+
+        self._move_between(get_neighbours)
+
+    def move_after(self, other):
+        """
+        Moves this row to just after `other`.
+        """
+        def get_neighbours():
+            other.position = self.__class__._base_manager \
+                    .values_list('position', flat=True) \
+                    .get(pk=other.pk)
+            after = self._others() \
+                    .filter(models.Q(position__gt=other.position)
+                            | models.Q(position=other.position, pk__gt=other.pk)) \
+                    .order_by('position', 'pk') \
+                    .values_list('position', flat=True) \
+                    .first()
+            return other.position, after
+
+        self._move_between(get_neighbours)
+
+    def move_to(self, index):
+        """
+        Moves this row to the 0-based `index` in the order. Indexes past the
+        end move it to the end.
+        """
+        others = self._position_queryset() \
+                .exclude(pk=self.pk) \
+                .order_by('position', 'pk')
+        if index <= 0:
+            target = others.first()
+            if target is not None:
+                self.move_before(target)
+        else:
+            targets = list(others[index - 1:index])
+            target = targets[0] if targets else others.last()
+            if target is not None:
+                self.move_after(target)
+
+    @classmethod
+    def _set_positions(cls, positions):
+        """
+        Updates the positions given as `(pk, position)` pairs with one UPDATE
+        per batch.
+        """
+        positions = list(positions)
+        for i in range(0, len(positions), 500):
+            batch = positions[i:i + 500]
+            cls._base_manager \
+                    .filter(pk__in=[pk for pk, position in batch]) \
+                    .update(position=models.Case(
+                        *[models.When(pk=pk, then=models.Value(position))
+                          for pk, position in batch],
+                        output_field=models.IntegerField()))
+
+    @classmethod
+    def reorder(cls, pks):
+        """
+        Puts the rows with the given primary keys in that order, spaced
+        `position_gap` apart, updating them in bulk.
+        """
+        with transaction.atomic():
+            cls._set_positions((pk, index * cls.position_gap)
+                    for index, pk in enumerate(pks))
+
+    def rebalance(self):
+        """
+        Renumbers the rows in this row's scope `position_gap` apart, keeping
+        their order.
+        """
+        with transaction.atomic():
+            pks = self._position_queryset() \
+                    .select_for_update() \
+                    .order_by('position', 'pk') \
+                    .values_list('pk', flat=True)
+            self.reorder(list(pks))
+            self.position = self.__class__._base_manager \
+                    .values_list('position', flat=True) \
+                    .get(pk=self.pk)
+
 
 class SlugField(models.SlugField):
     def __init__(self, *args, **kwargs):
@@ -169,6 +683,13 @@ class SlugField(models.SlugField):
         super(SlugField, self).__init__(*args, **kwargs)
 
 
+# Sent for each instance soft-deleted with `SoftDeleteMixin.delete()`, or with
+# `SoftDeleteQuerySet.delete(send_signals=True)`. Arguments: `sender` (the
+# model class) and `instance`.
+pre_soft_delete = Signal()
+post_soft_delete = Signal()
+
+
 class SoftDeleteMixin(models.Model):
     """
     Abstract Django model mixin to add 'deleted' column
@@ -184,10 +705,14 @@ class SoftDeleteMixin(models.Model):
     )
 
     deleted = models.IntegerField(choices=STATE_CHOICES, default=OK)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def delete(self, *args, **kwargs):
+        pre_soft_delete.send(sender=self.__class__, instance=self)
         self.deleted = self.DELETED
+        self.deleted_at = timezone.now()
         self.save()
+        post_soft_delete.send(sender=self.__class__, instance=self)
 
     def remove_permanently(self, *args, **kwargs):
         super(SoftDeleteMixin, self).delete(*args, **kwargs)
@@ -200,9 +725,59 @@ class SoftDeleteQuerySet(models.query.QuerySet):
     SubClass of the standard Django QuerySet that ignores soft-deleted rows,
     and overwrites the delete function to update with soft-delete instead
     """
-    def delete(self, using='default', *args, **kwargs):
-        for model in self:
-            model.delete(using, *args, **kwargs)
+    def delete(self, send_signals=False):
+        """
+        Soft-deletes the rows in the queryset with a single UPDATE, without
+        loading them. Rows that are already deleted aren't counted.
+
+        :param send_signals: load the instances so that `pre_soft_delete` and
+        `post_soft_delete` are sent for each of them
+        :type send_signals: bool
+
+        Returns a tuple of the number of rows deleted and a dictionary with the
+        number per model, like `QuerySet.delete()`.
+        """
+        assert self.query.can_filter(), \
+                "Cannot use 'limit' or 'offset' with delete."
+
+        queryset = self.filter(deleted=SoftDeleteMixin.OK)
+        now = timezone.now()
+        if send_signals:
+            instances = list(queryset)
+            for instance in instances:
+                pre_soft_delete.send(sender=self.model, instance=instance)
+
+            count = 0
+            for i in range(0, len(instances), 500):
+                pks = [instance.pk for instance in instances[i:i + 500]]
+                count += self.model._base_manager \
+                        .filter(pk__in=pks, deleted=SoftDeleteMixin.OK) \
+                        .update(deleted=SoftDeleteMixin.DELETED, deleted_at=now)
+
+            if _caches_objects(self.model):
+                invalidate_cached_objects(self.model,
+                        [instance.pk for instance in instances])
+
+            for instance in instances:
+                instance.deleted = SoftDeleteMixin.DELETED
+                instance.deleted_at = now
+                post_soft_delete.send(sender=self.model, instance=instance)
+        elif _caches_objects(self.model):
+            # The cached copies of the rows have to be invalidated, so look
+            # up which rows are affected first.
+            pks = list(queryset.values_list('pk', flat=True))
+            count = 0
+            for i in range(0, len(pks), 500):
+                count += self.model._base_manager \
+                        .filter(pk__in=pks[i:i + 500], deleted=SoftDeleteMixin.OK) \
+                        .update(deleted=SoftDeleteMixin.DELETED, deleted_at=now)
+            invalidate_cached_objects(self.model, pks)
+        else:
+            count = queryset.update(deleted=SoftDeleteMixin.DELETED,
+                    deleted_at=now)
+
+        opts = self.model._meta
+        return count, {'{}.{}'.format(opts.app_label, opts.object_name): count}
 
     def remove_permanently(self):
         return super(SoftDeleteQuerySet, self).delete()
@@ -219,12 +794,142 @@ class SoftDeleteQuerySet(models.query.QuerySet):
         qs.__class__ = SoftDeleteQuerySet
         return qs
 
+def purge_soft_deleted(model, batch_size=None, min_age=None, sleep=0,
+        progress=None):
+    """
+    Permanently deletes the soft-deleted rows of `model` in primary key order,
+    one batch per transaction, so that no single statement locks the whole
+    table.
+
+    :param batch_size: number of rows deleted per batch (default:
+    `settings.SOFT_DELETE_PURGE_BATCH_SIZE`)
+    :type batch_size: int
+
+    :param min_age: only purge rows deleted at least this long ago, as a
+    `timedelta` or a number of seconds. Rows deleted before `deleted_at` was
+    recorded are skipped when this is given.
+    :type min_age: datetime.timedelta
+
+    :param sleep: seconds to pause between batches
+    :type sleep: float
+
+    :param progress: called with the number of rows purged so far after each
+    batch
+    :type progress: function
+
+    Returns the number of rows purged.
+    """
+    if batch_size is None:
+        batch_size = settings.SOFT_DELETE_PURGE_BATCH_SIZE
+
+    queryset = model._base_manager \
+            .filter(deleted=SoftDeleteMixin.DELETED) \
+            .order_by('pk')
+    if min_age is not None:
+        if isinstance(min_age, numbers.Number):
+            min_age = datetime.timedelta(seconds=min_age)
+        queryset = queryset.filter(deleted_at__lte=timezone.now() - min_age)
+
+    purged = 0
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+
+        with transaction.atomic():
+            # Filter again so rows restored since the pks were read survive.
+            _, deleted = queryset.filter(pk__in=pks).delete()
+
+        purged += deleted.get(model._meta.label, 0)
+        last_pk = pks[-1]
+        if progress is not None:
+            progress(purged)
+
+        if len(pks) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    return purged
+
+_object_cache = LRUCache(settings.SOFT_DELETE_CACHE_ENTRIES,
+        timeout=settings.SOFT_DELETE_CACHE_LOCAL_TIMEOUT)
+
+def _object_cache_key(model, pk):
+    opts = model._meta
+    return 'lionheart:objects:{}.{}:{}'.format(opts.app_label, opts.model_name, pk)
+
+def _object_generation(cache, key):
+    """
+    Returns the current generation of the cached object `key`. Entries in the
+    shared cache are stored under their generation, which invalidation
+    replaces, so a read that started before an invalidation can't store the
+    old row where later reads will find it.
+    """
+    generation_key = key + ':generation'
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, uuid.uuid4().hex, settings.SOFT_DELETE_CACHE_TIMEOUT)
+        generation = cache.get(generation_key)
+    return generation
+
+def _caches_objects(model):
+    return getattr(model._default_manager, 'cache_objects', False)
+
+def invalidate_cached_objects(model, pks):
+    """
+    Removes the instances of `model` with the primary keys `pks` from the
+    caches of `SoftDeleteManager(cache_objects=True)`, now and again when the
+    current transaction commits (so that a read in between can't cache the
+    old row).
+    """
+    keys = [_object_cache_key(model, pk) for pk in pks]
+    if not keys:
+        return
+
+    def invalidate():
+        for key in keys:
+            _object_cache.delete(key)
+        get_cache(settings.SOFT_DELETE_CACHE).set_many(
+                dict((key + ':generation', uuid.uuid4().hex) for key in keys),
+                settings.SOFT_DELETE_CACHE_TIMEOUT)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+def _invalidate_cached_object(sender, instance, **kwargs):
+    invalidate_cached_objects(sender, [instance.pk])
+
 class SoftDeleteManager(models.Manager):
     """
     Soft Delete Object Manager that uses the SoftDeleteQuerySet so when you use objects.all(),
     rows with deleted=DELETED will not be returned!
     Also adds propeties to see deleted/active rows
+
+    With `cache_objects=True`, `get(pk=...)` (optionally with `deleted=...`)
+    reads through an in-process LRU and the cache named by
+    `settings.SOFT_DELETE_CACHE`. Cached entries are invalidated when an
+    instance is saved, soft-deleted or removed permanently, and by
+    `SoftDeleteQuerySet.delete()`; `QuerySet.update()` bypasses them.
+
+        class Article(SoftDeleteMixin):
+            objects = SoftDeleteManager(cache_objects=True)
     """
+    def __init__(self, cache_objects=False):
+        super(SoftDeleteManager, self).__init__()
+        self.cache_objects = cache_objects
+
+    def contribute_to_class(self, model, name):
+        super(SoftDeleteManager, self).contribute_to_class(model, name)
+        if self.cache_objects and not model._meta.abstract:
+            uid = 'lionheart.models.SoftDeleteManager.{}'.format(_object_cache_key(model, ''))
+            post_save.connect(_invalidate_cached_object, sender=model, dispatch_uid=uid)
+            post_delete.connect(_invalidate_cached_object, sender=model, dispatch_uid=uid)
+
     def all_with_deleted(self):
         qs = super(SoftDeleteManager, self).get_queryset()
         if hasattr(self, 'core_filters'):  # it's a RelatedManager
@@ -242,9 +947,47 @@ class SoftDeleteManager(models.Manager):
     def remove_permanently(self):
         return super(SoftDeleteManager, self).get_queryset().delete()
 
+    def purge(self, *args, **kwargs):
+        """
+        Permanently deletes soft-deleted rows in batches. See
+        `purge_soft_deleted`.
+        """
+        return purge_soft_deleted(self.model, *args, **kwargs)
+
     def get(self, *args, **kwargs):
+        if self.cache_objects and not args and not hasattr(self, 'core_filters') \
+                and ('pk' in kwargs or 'id' in kwargs) \
+                and set(kwargs) <= set(['pk', 'id', 'deleted']) \
+                and len(kwargs) - ('deleted' in kwargs) == 1:
+            return self._get_cached(kwargs.get('pk', kwargs.get('id')),
+                    kwargs.get('deleted'))
         return self._queryset_from_kwarg_conditions(kwargs).get(*args, **kwargs)
 
+    def _get_cached(self, pk, deleted=None):
+        """
+        Returns a copy of the cached instance with the primary key `pk`,
+        loading it (deleted or not) on a miss. Entries are stored with their
+        `deleted` state, so `deleted` is checked without a query.
+        """
+        pk = self.model._meta.pk.to_python(pk)
+        key = _object_cache_key(self.model, pk)
+        instance = _object_cache.get(key)
+        if instance is None:
+            cache = get_cache(settings.SOFT_DELETE_CACHE)
+            generation = _object_generation(cache, key)
+            entry_key = '{}:{}'.format(key, generation)
+            instance = cache.get(entry_key)
+            if instance is None:
+                instance = self.all_with_deleted().get(pk=pk)
+                if generation is not None:
+                    cache.add(entry_key, instance, settings.SOFT_DELETE_CACHE_TIMEOUT)
+            _object_cache.set(key, instance)
+
+        if deleted is not None and instance.deleted != int(deleted):
+            raise self.model.DoesNotExist(
+                "{} matching query does not exist.".format(self.model._meta.object_name))
+        return copy.deepcopy(instance)
+
     def filter(self, *args, **kwargs):
         qs = self._queryset_from_kwarg_conditions(kwargs).filter(*args, **kwargs)
         # Cast qs to SoftDeleteQuery because super() returns a plain ol' QuerySet
@@ -0,0 +1,241 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings as django_settings
+from django.db import models
+from django.db import transaction
+
+from lionheart import settings
+from lionheart.utils import get_cache
+
+def update_redirects(old_path, new_path):
+    """
+    Records that the page at `old_path` moved to `new_path`: existing
+    redirects to `old_path` are pointed at `new_path`, a redirect from
+    `old_path` is created, and any redirect away from `new_path` is removed to
+    avoid a loop.
+    """
+    from django.contrib.redirects.models import Redirect
+
+    site_id = getattr(django_settings, 'SITE_ID', 1)
+    with transaction.atomic():
+        Redirect.objects \
+                .filter(site_id=site_id, new_path=old_path) \
+                .update(new_path=new_path)
+        Redirect.objects \
+                .filter(site_id=site_id, old_path=new_path) \
+                .delete()
+        Redirect.objects.update_or_create(site_id=site_id, old_path=old_path,
+                defaults={'new_path': new_path})
+        transaction.on_commit(redirect_table.invalidate)
+
+def collapse_redirects(paths):
+    """
+    Given a dictionary of `old_path` to `new_path`, returns one mapping each
+    `old_path` to the end of its chain of redirects, so that any path is
+    resolved with a single lookup. Paths that are part of a cycle keep their
+    original target.
+    """
+    collapsed = {}
+    for old_path, new_path in paths.items():
+        seen = set([old_path])
+        final_path = new_path
+        while final_path in paths and final_path not in seen:
+            if final_path in collapsed:
+                final_path = collapsed[final_path]
+                break
+            seen.add(final_path)
+            final_path = paths[final_path]
+
+        if final_path in seen:
+            final_path = new_path
+        collapsed[old_path] = final_path
+    return collapsed
+
+class RedirectTable(object):
+    """
+    In-process copy of the current site's redirects, collapsed with
+    `collapse_redirects`.
+
+    The table is shared between processes through the cache named by
+    `settings.REDIRECT_CACHE`, under a version key that `invalidate` changes.
+    Each process reloads when the version changes, or at the latest every
+    `settings.REDIRECT_CACHE_TIMEOUT` seconds.
+    """
+    version_key = 'lionheart:redirects:version'
+    table_key = 'lionheart:redirects:table:{}:{}'
+
+    def __init__(self):
+        self.paths = None
+        self.version = None
+        self.loaded_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+
+    def _load(self, version):
+        from django.contrib.redirects.models import Redirect
+
+        site_id = getattr(django_settings, 'SITE_ID', 1)
+        cache = get_cache(settings.REDIRECT_CACHE)
+        key = self.table_key.format(site_id, version)
+        paths = cache.get(key)
+        if paths is None:
+            paths = collapse_redirects(dict(Redirect.objects
+                    .filter(site_id=site_id)
+                    .values_list('old_path', 'new_path')))
+            cache.set(key, paths, settings.REDIRECT_CACHE_TIMEOUT)
+        return paths
+
+    def get_paths(self):
+        cache = get_cache(settings.REDIRECT_CACHE)
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.version_key, version, None)
+            version = cache.get(self.version_key, version)
+
+        with self._lock:
+            if self.paths is None or version != self.version \
+                    or time.time() - self.loaded_at > settings.REDIRECT_CACHE_TIMEOUT:
+                self.paths = self._load(version)
+                self.version = version
+                self.loaded_at = time.time()
+                self.reloads += 1
+            return self.paths
+
+    def resolve(self, path):
+        """
+        Returns the final `new_path` for `path` (an empty string meaning the
+        page is gone), or `None` if there's no redirect from it.
+        """
+        new_path = self.get_paths().get(path)
+        with self._lock:
+            if new_path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return new_path
+
+    def invalidate(self, **kwargs):
+        """
+        Makes every process reload the table on its next lookup.
+        """
+        get_cache(settings.REDIRECT_CACHE).set(self.version_key, uuid.uuid4().hex, None)
+        with self._lock:
+            self.paths = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+            'size': len(self.paths or ()) }
+
+redirect_table = RedirectTable()
+
+def get_changed_path(instance):
+    """
+    Returns the `(old_path, new_path)` of `instance` if saving it will change
+    its `get_absolute_url()`, and `None` otherwise.
+
+    Instances of `RedirectTrackingMixin` are checked against the snapshot
+    taken when they were loaded, without a query; others are compared with a
+    fresh copy of the row.
+    """
+    if instance._state.adding or instance.pk is None:
+        return None
+
+    snapshot = getattr(instance, '_redirect_snapshot', None)
+    if snapshot is not None and RedirectTrackingMixin.DEFERRED not in snapshot.values():
+        if all(getattr(instance, attname) == value
+               for attname, value in snapshot.items()):
+            return None
+
+        previous = copy.copy(instance)
+        previous._state = copy.copy(instance._state)
+        if hasattr(previous._state, 'fields_cache'):
+            # Related objects may have changed along with their keys.
+            previous._state.fields_cache = {}
+        previous.__dict__.update(snapshot)
+    else:
+        Model = instance.__class__
+        try:
+            previous = Model._base_manager.get(pk=instance.pk)
+        except Model.DoesNotExist:
+            return None
+
+    old_path = previous.get_absolute_url()
+    new_path = instance.get_absolute_url()
+    if old_path == new_path:
+        return None
+    return old_path, new_path
+
+
+class RedirectTrackingMixin(models.Model):
+    """
+    Abstract model mixin that creates a redirect whenever saving changes an
+    instance's `get_absolute_url()`.
+
+    The fields listed in `redirect_fields` (default: every field) are
+    snapshotted when an instance is loaded, so saves that don't touch them
+    skip the URL comparison entirely and none of them need an extra query.
+
+        class Article(RedirectTrackingMixin, models.Model):
+            slug = models.SlugField()
+            redirect_fields = ('slug',)
+
+            def get_absolute_url(self):
+                return '/articles/{}/'.format(self.slug)
+    """
+    DEFERRED = object()
+
+    redirect_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(RedirectTrackingMixin, cls).from_db(db, field_names, values)
+        instance.snapshot_redirect_fields()
+        return instance
+
+    def snapshot_redirect_fields(self):
+        if self.redirect_fields:
+            attnames = [self._meta.get_field(name).attname
+                        for name in self.redirect_fields]
+        else:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+
+        self._redirect_snapshot = dict(
+                (attname, self.__dict__.get(attname, self.DEFERRED))
+                for attname in attnames)
+
+    def save(self, *args, **kwargs):
+        paths = get_changed_path(self)
+        if paths is None:
+            super(RedirectTrackingMixin, self).save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                update_redirects(*paths)
+                super(RedirectTrackingMixin, self).save(*args, **kwargs)
+
+        self.snapshot_redirect_fields()
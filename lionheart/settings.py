@@ -25,6 +25,91 @@ if hasattr(settings, 'REDIS'):
 HOME_URL = getattr(settings, 'HOME_URL', '/')
 PRIMARY_USER_MODEL = getattr(settings, 'PRIMARY_USER_MODEL', 'app.User')
 
+# Size of the chunk rows that BinaryDatabaseStorage splits large files into.
+DATABASE_STORAGE_CHUNK_SIZE = getattr(settings, 'DATABASE_STORAGE_CHUNK_SIZE', 1024 * 1024)
+
+# Number of names looked up per query by the storages' batch methods.
+DATABASE_STORAGE_BATCH_SIZE = getattr(settings, 'DATABASE_STORAGE_BATCH_SIZE', 500)
+
+# Compression codec ('zlib', 'bz2' or 'lzma') and level used by
+# BinaryDatabaseStorage, or None to store files as-is. A file is only kept
+# compressed if that shrinks it below DATABASE_STORAGE_COMPRESSION_MIN_RATIO of
+# its size, and mime types starting with one of
+# DATABASE_STORAGE_UNCOMPRESSED_TYPES aren't compressed at all.
+DATABASE_STORAGE_COMPRESSION = getattr(settings, 'DATABASE_STORAGE_COMPRESSION', None)
+DATABASE_STORAGE_COMPRESSION_LEVEL = getattr(settings, 'DATABASE_STORAGE_COMPRESSION_LEVEL', None)
+DATABASE_STORAGE_COMPRESSION_MIN_RATIO = getattr(settings, 'DATABASE_STORAGE_COMPRESSION_MIN_RATIO', 0.9)
+DATABASE_STORAGE_UNCOMPRESSED_TYPES = getattr(settings, 'DATABASE_STORAGE_UNCOMPRESSED_TYPES', (
+    'image/gif', 'image/jpeg', 'image/png', 'image/webp', 'audio/', 'video/',
+    'font/woff', 'application/font-woff', 'application/gzip',
+    'application/pdf', 'application/x-7z-compressed', 'application/x-bzip2',
+    'application/x-gzip', 'application/x-rar-compressed', 'application/x-xz',
+    'application/zip'))
+
+# Read-through cache for the database storages. Files up to
+# DATABASE_STORAGE_CACHE_MAX_FILE_SIZE bytes are kept in an in-process LRU of
+# DATABASE_STORAGE_CACHE_SIZE bytes, and metadata (size, mime type, mtime) for
+# up to DATABASE_STORAGE_METADATA_CACHE_ENTRIES files. Set
+# DATABASE_STORAGE_CACHE to a cache alias to add Django's cache as a second tier.
+# Saves and deletes only clear the in-process entries of the process that made
+# them, so other processes may serve the old file for up to
+# DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT seconds.
+DATABASE_STORAGE_CACHE_SIZE = getattr(settings, 'DATABASE_STORAGE_CACHE_SIZE', 8 * 1024 * 1024)
+DATABASE_STORAGE_CACHE_MAX_FILE_SIZE = getattr(settings, 'DATABASE_STORAGE_CACHE_MAX_FILE_SIZE', 256 * 1024)
+DATABASE_STORAGE_METADATA_CACHE_ENTRIES = getattr(settings, 'DATABASE_STORAGE_METADATA_CACHE_ENTRIES', 1024)
+DATABASE_STORAGE_CACHE = getattr(settings, 'DATABASE_STORAGE_CACHE', None)
+DATABASE_STORAGE_CACHE_TIMEOUT = getattr(settings, 'DATABASE_STORAGE_CACHE_TIMEOUT', 300)
+DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT = getattr(settings, 'DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT', 5)
+
+# URL that `lionheart.file_urls` is included under (e.g. '/files/'). When set,
+# the database storages return links to it instead of inline data URIs.
+DATABASE_STORAGE_BASE_URL = getattr(settings, 'DATABASE_STORAGE_BASE_URL', None)
+
+# `lionheart.file_urls` serves any stored file to anyone who knows its name.
+# Set DATABASE_STORAGE_ACCESS_CHECK to the dotted path of a function taking
+# `(request, name)` and returning whether the file may be served. Files are
+# shown inline only if their type starts with one of
+# DATABASE_STORAGE_INLINE_TYPES; everything else (HTML, SVG, ...) is sent as
+# an attachment with a sandboxing Content-Security-Policy.
+DATABASE_STORAGE_ACCESS_CHECK = getattr(settings, 'DATABASE_STORAGE_ACCESS_CHECK', None)
+DATABASE_STORAGE_INLINE_TYPES = getattr(settings, 'DATABASE_STORAGE_INLINE_TYPES', (
+    'image/gif', 'image/jpeg', 'image/png', 'image/webp', 'image/bmp',
+    'audio/', 'video/'))
+
+# Number of rows fetched per query by the streaming admin export actions.
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+# Number of processes used to render primary key shards of an export.
+EXPORT_WORKERS = getattr(settings, 'EXPORT_WORKERS', 1)
+
+# Background export jobs (requires the `ExportJob` table). Finished exports are
+# stored under EXPORT_JOB_UPLOAD_TO/<random>/ and downloaded through a
+# staff-only admin view, but the storage itself should not be public.
+EXPORT_JOBS_ENABLED = getattr(settings, 'EXPORT_JOBS_ENABLED', False)
+EXPORT_JOB_WORKERS = getattr(settings, 'EXPORT_JOB_WORKERS', 2)
+EXPORT_JOB_UPLOAD_TO = getattr(settings, 'EXPORT_JOB_UPLOAD_TO', 'exports')
+
+# Incremental exports (requires the `ExportCheckpoint` table).
+EXPORT_CHECKPOINTS_ENABLED = getattr(settings, 'EXPORT_CHECKPOINTS_ENABLED', False)
+
+# Cache used by `lionheart.middleware.RedirectMiddleware` to share the
+# redirect table between processes, and the longest time a process keeps
+# its copy without checking for changes.
+REDIRECT_CACHE = getattr(settings, 'REDIRECT_CACHE', 'default')
+REDIRECT_CACHE_TIMEOUT = getattr(settings, 'REDIRECT_CACHE_TIMEOUT', 300)
+
+# Number of rows deleted per transaction by `purge_soft_deleted`.
+SOFT_DELETE_PURGE_BATCH_SIZE = getattr(settings, 'SOFT_DELETE_PURGE_BATCH_SIZE', 1000)
+
+# Caches used by `SoftDeleteManager(cache_objects=True)` for pk lookups: an
+# in-process LRU of SOFT_DELETE_CACHE_ENTRIES objects, which may serve an
+# object changed by another process for up to SOFT_DELETE_CACHE_LOCAL_TIMEOUT
+# seconds, in front of the Django cache named by SOFT_DELETE_CACHE.
+SOFT_DELETE_CACHE = getattr(settings, 'SOFT_DELETE_CACHE', 'default')
+SOFT_DELETE_CACHE_TIMEOUT = getattr(settings, 'SOFT_DELETE_CACHE_TIMEOUT', 300)
+SOFT_DELETE_CACHE_ENTRIES = getattr(settings, 'SOFT_DELETE_CACHE_ENTRIES', 1024)
+SOFT_DELETE_CACHE_LOCAL_TIMEOUT = getattr(settings, 'SOFT_DELETE_CACHE_LOCAL_TIMEOUT', 5)
+
 try:
     from redis import Redis
 except ImportError:
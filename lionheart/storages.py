@@ -12,25 +12,313 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import StringIO
 import base64
+import bz2
+import hashlib
+import io
+import itertools
 import mimetypes
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 
 from django.core.files import File
+from django.core.files.base import ContentFile
 from django.core.files.storage import Storage
+from django.db import connections
+from django.db import transaction
+from django.utils.encoding import filepath_to_uri
+
+try:
+    from urllib.parse import urljoin
+except ImportError:
+    from urlparse import urljoin
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from lionheart import settings
+from lionheart.utils import LRUCache
+from lionheart.utils import get_cache
+from lionheart.models import BinaryUploadedFile
+from lionheart.models import BinaryUploadedFileChunk
+from lionheart.models import FileReference
 from lionheart.models import UploadedFile
 
-class Base64DatabaseStorage(Storage):
+_metadata_cache = LRUCache(
+        max_entries=settings.DATABASE_STORAGE_METADATA_CACHE_ENTRIES,
+        timeout=settings.DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT)
+_content_cache = LRUCache(
+        max_entries=settings.DATABASE_STORAGE_METADATA_CACHE_ENTRIES,
+        max_size=settings.DATABASE_STORAGE_CACHE_SIZE,
+        timeout=settings.DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT)
+
+class CachedStorageMixin(object):
+    """
+    Read-through cache for the database storages. Metadata (size, mime type
+    and modification time) is cached for every file that's looked up, and
+    the content of files up to `settings.DATABASE_STORAGE_CACHE_MAX_FILE_SIZE`
+    bytes is kept in a size-bounded LRU. Both are checked in-process first,
+    then in the Django cache named by `settings.DATABASE_STORAGE_CACHE` (if
+    any), and are invalidated when a file is saved or deleted.
+
+    Invalidation clears the shared cache, but only this process's own
+    in-process entries. Other processes keep theirs for at most
+    `settings.DATABASE_STORAGE_LOCAL_CACHE_TIMEOUT` seconds, so they may read
+    stale content, sizes or `exists()` answers for that long after a save or
+    delete.
+
+    Batch versions of the lookups (`metadata_many`, `sizes`, `urls` and
+    `existing`) resolve a list of names with one `__in` query per
+    `settings.DATABASE_STORAGE_BATCH_SIZE` names that aren't cached yet.
+
+    Subclasses set `cache_prefix` and `name_field`, and implement
+    `_metadata_queryset()`, returning a queryset that doesn't load file
+    content, and `_metadata_from(obj)`, returning the result of
+    `_build_metadata` for one of its objects.
+    """
+    cache_prefix = None
+    name_field = 'filename'
+
+    def _build_metadata(self, name, size, modified_time=None):
+        mime_type, encoding = mimetypes.guess_type(name)
+        return {
+            'size': size,
+            'mime_type': mime_type,
+            'modified_time': modified_time }
+
+    def _shared_cache_key(self, kind, name):
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        return 'lionheart:storage:{}:{}:{}'.format(self.cache_prefix, kind, digest)
+
+    def _get_cached(self, cache, kind, name):
+        value = cache.get((self.cache_prefix, name))
+        if value is None:
+            shared_cache = get_cache(settings.DATABASE_STORAGE_CACHE)
+            if shared_cache is not None:
+                value = shared_cache.get(self._shared_cache_key(kind, name))
+                if value is not None:
+                    cache.set((self.cache_prefix, name), value)
+        return value
+
+    def _set_cached(self, cache, kind, name, value):
+        cache.set((self.cache_prefix, name), value)
+        shared_cache = get_cache(settings.DATABASE_STORAGE_CACHE)
+        if shared_cache is not None:
+            shared_cache.set(self._shared_cache_key(kind, name), value,
+                    settings.DATABASE_STORAGE_CACHE_TIMEOUT)
+
+    def _cache_metadata(self, name, metadata):
+        self._set_cached(_metadata_cache, 'metadata', name, metadata)
+
+    def _cache_content(self, name, content):
+        if len(content) <= settings.DATABASE_STORAGE_CACHE_MAX_FILE_SIZE:
+            self._set_cached(_content_cache, 'content', name, content)
+
+    def _cached_content(self, name):
+        return self._get_cached(_content_cache, 'content', name)
+
+    def _load_metadata(self, name):
+        obj = self._metadata_queryset().get(**{self.name_field: name})
+        return self._metadata_from(obj)
+
+    def metadata(self, name):
+        """
+        Returns a dictionary with the `size`, `mime_type` and `modified_time`
+        of the file, without loading its content.
+        """
+        metadata = self._get_cached(_metadata_cache, 'metadata', name)
+        if metadata is None:
+            metadata = self._load_metadata(name)
+            self._cache_metadata(name, metadata)
+        return metadata
+
+    def metadata_many(self, names):
+        """
+        Returns a dictionary mapping each of `names` that exists to its
+        metadata (see `metadata`).
+        """
+        result = {}
+        missing = []
+        for name in set(names):
+            metadata = _metadata_cache.get((self.cache_prefix, name))
+            if metadata is None:
+                missing.append(name)
+            else:
+                result[name] = metadata
+
+        shared_cache = get_cache(settings.DATABASE_STORAGE_CACHE)
+        if missing and shared_cache is not None:
+            keys = dict((self._shared_cache_key('metadata', name), name)
+                    for name in missing)
+            for key, metadata in shared_cache.get_many(list(keys)).items():
+                _metadata_cache.set((self.cache_prefix, keys[key]), metadata)
+                result[keys[key]] = metadata
+            missing = [name for name in missing if name not in result]
+
+        batch_size = settings.DATABASE_STORAGE_BATCH_SIZE
+        for i in range(0, len(missing), batch_size):
+            lookup = {self.name_field + '__in': missing[i:i + batch_size]}
+            for obj in self._metadata_queryset().filter(**lookup):
+                name = getattr(obj, self.name_field)
+                result[name] = self._metadata_from(obj)
+                self._cache_metadata(name, result[name])
+
+        return result
+
+    def sizes(self, names):
+        """
+        Returns a dictionary mapping each of `names` that exists to its size.
+        """
+        return dict((name, metadata['size'])
+                for name, metadata in self.metadata_many(names).items())
+
+    def urls(self, names):
+        """
+        Returns a dictionary mapping each of `names` that exists to its URL.
+        """
+        if settings.DATABASE_STORAGE_BASE_URL is None:
+            return self._data_urls(names)
+        return dict((name, self.url(name)) for name in self.metadata_many(names))
+
+    def _data_urls(self, names):
+        return dict((name, self._data_url(name)) for name in self.metadata_many(names))
+
+    def existing(self, names):
+        """
+        Returns the set of `names` that exist.
+        """
+        return set(self.metadata_many(names))
+
+    def exists(self, name):
+        if _metadata_cache.get((self.cache_prefix, name)) is not None:
+            return True
+        return self._metadata_queryset() \
+                .filter(**{self.name_field: name}) \
+                .exists()
+
+    def listdir(self, path):
+        path = path.strip('/')
+        prefix = path + '/' if path else ''
+        names = self._metadata_queryset() \
+                .filter(**{self.name_field + '__startswith': prefix}) \
+                .values_list(self.name_field, flat=True)
+
+        directories = set()
+        files = []
+        for name in names:
+            name = name[len(prefix):]
+            if '/' in name:
+                directories.add(name.split('/', 1)[0])
+            else:
+                files.append(name)
+        return sorted(directories), sorted(files)
+
+    def invalidate(self, name):
+        """
+        Removes the file from the cache, in this process and in the shared
+        cache.
+        """
+        _metadata_cache.delete((self.cache_prefix, name))
+        _content_cache.delete((self.cache_prefix, name))
+
+        shared_cache = get_cache(settings.DATABASE_STORAGE_CACHE)
+        if shared_cache is not None:
+            shared_cache.delete_many([
+                self._shared_cache_key('metadata', name),
+                self._shared_cache_key('content', name)])
+
+    def _invalidate_on_commit(self, name):
+        # Invalidate right away for reads within the transaction, and again
+        # once it commits in case a concurrent read cached the old file.
+        self.invalidate(name)
+        transaction.on_commit(lambda: self.invalidate(name))
+
+    def digest(self, name):
+        """
+        Returns the SHA-256 hex digest of the file's content, computing and
+        caching it for files saved without one.
+        """
+        metadata = self.metadata(name)
+        if not metadata.get('digest'):
+            digest = hashlib.sha256()
+            file = self._open(name)
+            for data in file.chunks():
+                digest.update(data)
+            file.close()
+
+            metadata = dict(metadata, digest=digest.hexdigest())
+            self._cache_metadata(name, metadata)
+        return metadata['digest']
+
+    def etag(self, name):
+        """
+        Returns a value that changes whenever the file's content does, for use
+        as an HTTP entity tag. This is the content digest unless the storage
+        can identify a version of the file more cheaply.
+        """
+        return self.digest(name)
+
+    def url(self, name):
+        if settings.DATABASE_STORAGE_BASE_URL is None:
+            return self._data_url(name)
+        return urljoin(settings.DATABASE_STORAGE_BASE_URL, filepath_to_uri(name))
+
+    def size(self, name):
+        return self.metadata(name)['size']
+
+    def get_modified_time(self, name):
+        modified_time = self.metadata(name)['modified_time']
+        if modified_time is None:
+            raise NotImplementedError("This storage doesn't record modification times.")
+        return modified_time
+
+class Base64DatabaseStorage(CachedStorageMixin, Storage):
     """
     Class DatabaseStorage provides storing files in the database.
     """
+    cache_prefix = 'base64'
+
+    def _metadata_queryset(self):
+        return UploadedFile.objects.defer('blob')
+
+    def _metadata_from(self, obj):
+        # The legacy table doesn't record modification times or digests, but
+        # rows are never rewritten in place, so the row id plus the size
+        # identifies a version of the file.
+        metadata = self._build_metadata(obj.filename, obj.size)
+        metadata['version'] = '{}-{}'.format(obj.pk, obj.size)
+        return metadata
+
+    def etag(self, name):
+        # Avoids loading and hashing the whole blob just to answer a
+        # conditional request.
+        metadata = self.metadata(name)
+        if metadata.get('version'):
+            return metadata['version']
+        return self.digest(name)
+
+    def _read(self, name):
+        content = self._cached_content(name)
+        if content is None:
+            obj = UploadedFile.objects.get(filename=name)
+            content = base64.b64decode(obj.blob)
+            self._cache_metadata(name, self._metadata_from(obj))
+            self._cache_content(name, content)
+        return content
 
     def _open(self, name, mode='rb'):
         assert mode == 'rb', "You've tried to open binary file without specifying binary mode! You specified: %s" % mode
 
-        obj = UploadedFile.objects.get(filename=name)
-        file = StringIO.StringIO(base64.b64decode(obj.blob))
+        file = io.BytesIO(self._read(name))
         file.name = name
         file.mode = mode
         return File(file)
@@ -38,27 +326,817 @@ class Base64DatabaseStorage(Storage):
     def _save(self, name, content):
         name = name.replace('\\', '/')
         binary = content.read()
-        encoded = base64.b64encode(binary)
+        encoded = base64.b64encode(binary).decode('ascii')
         size = len(binary)
 
         UploadedFile.objects.get_or_create(filename=name, defaults={
             'blob': encoded,
             'size': size })
+        self._invalidate_on_commit(name)
         return name
 
-    def get_available_name(self, name):
+    def get_available_name(self, name, max_length=None):
         return name
 
     def delete(self, name):
         UploadedFile.objects.filter(filename=name).delete()
+        self._invalidate_on_commit(name)
 
-    def url(self, name):
-        uploaded_file = UploadedFile.objects.get(filename=name)
-        mtype, encoding = mimetypes.guess_type(name)
-        return "data:{0};base64,{1}".format(mtype, uploaded_file.blob)
+    def _data_url(self, name):
+        encoded = base64.b64encode(self._read(name)).decode('ascii')
+        return "data:{0};base64,{1}".format(self.metadata(name)['mime_type'], encoded)
 
-    def size(self, name):
-        uploaded_file = UploadedFile.objects.get(filename=name)
-        return uploaded_file.size
+    def _data_urls(self, names):
+        # The blobs are stored base64-encoded already, so they can be used
+        # as-is.
+        urls = {}
+        names = list(set(names))
+        batch_size = settings.DATABASE_STORAGE_BATCH_SIZE
+        for i in range(0, len(names), batch_size):
+            files = UploadedFile.objects \
+                    .filter(filename__in=names[i:i + batch_size]) \
+                    .values_list('filename', 'blob')
+            for name, blob in files:
+                mime_type, encoding = mimetypes.guess_type(name)
+                urls[name] = "data:{0};base64,{1}".format(mime_type, blob)
+        return urls
+
+def _byte_chunks(content, chunk_size=None):
+    for data in content.chunks(chunk_size):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        yield data
+
+def _fixed_size_chunks(content, chunk_size, digest=None):
+    """
+    Reads `content` with `content.chunks()` and yields it in pieces of
+    exactly `chunk_size` bytes, except for the last one. If `digest` is
+    given, it's updated with the content as it's read.
+    """
+    buffer = bytearray()
+    for data in _byte_chunks(content, chunk_size):
+        if digest is not None:
+            digest.update(data)
+
+        buffer.extend(data)
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+
+    if buffer:
+        yield bytes(buffer)
+
+def _zlib_compressor(level):
+    return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level)
+
+def _bz2_compressor(level):
+    return bz2.BZ2Compressor(9 if level is None else level)
+
+def _lzma_compressor(level):
+    return lzma.LZMACompressor(preset=level)
+
+# Maps a codec name to functions returning a compressor for a given level and
+# a decompressor.
+COMPRESSION_CODECS = {
+    'zlib': (_zlib_compressor, zlib.decompressobj),
+    'bz2': (_bz2_compressor, bz2.BZ2Decompressor),
+}
+if lzma is not None:
+    COMPRESSION_CODECS['lzma'] = (_lzma_compressor, lzma.LZMADecompressor)
+
+def _is_compressible(mime_type):
+    if mime_type is None:
+        return True
+    return not mime_type.startswith(settings.DATABASE_STORAGE_UNCOMPRESSED_TYPES)
+
+class DatabaseFileReader(object):
+    """
+    Read-only, seekable file object over a `BinaryUploadedFile`. Chunks are
+    fetched from the database as they're read and only the current one is
+    kept in memory, so memory use per open file is bounded by the chunk size.
+    """
+
+    def __init__(self, uploaded_file, name, mode='rb'):
+        self.name = name
+        self.mode = mode
+        if uploaded_file.codec:
+            # Reads the compressed bytes; see `DecompressingFileReader`.
+            self.size = uploaded_file.compressed_size
+        else:
+            self.size = uploaded_file.size
+        self.closed = False
+        self._file_id = uploaded_file.pk
+        self._position = 0
+
+        if uploaded_file.chunk_size:
+            self._chunk_size = uploaded_file.chunk_size
+            self._chunk_index = None
+            self._chunk = b''
+        else:
+            # Small files are stored inline as a single chunk.
+            self._chunk_size = max(self.size, 1)
+            self._chunk_index = 0
+            self._chunk = bytes(uploaded_file.data)
+
+    def _get_chunk(self, index):
+        if index != self._chunk_index:
+            data = BinaryUploadedFileChunk.objects \
+                    .filter(file_id=self._file_id, index=index) \
+                    .values_list('data', flat=True) \
+                    .get()
+            self._chunk = bytes(data)
+            self._chunk_index = index
+        return self._chunk
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        pieces = []
+        while size > 0:
+            index, offset = divmod(self._position, self._chunk_size)
+            piece = self._get_chunk(index)[offset:offset + size]
+            if not piece:
+                break
+
+            pieces.append(piece)
+            self._position += len(piece)
+            size -= len(piece)
+
+        return b''.join(pieces)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise IOError("Negative seek position {}".format(offset))
+
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def close(self):
+        self._chunk = b''
+        self._chunk_index = None
+        self.closed = True
+
+class DecompressingFileReader(object):
+    """
+    Read-only file object that decompresses a `DatabaseFileReader` over a
+    compressed file as it's read. Seeking forward decompresses and discards
+    the skipped content; seeking backward starts again from the beginning.
+    """
+
+    def __init__(self, raw, codec, size):
+        self.raw = raw
+        self.codec = codec
+        self.name = raw.name
+        self.mode = raw.mode
+        self.size = size
+        self.closed = False
+        self._rewind()
+
+    def _rewind(self):
+        self.raw.seek(0)
+        self._decompressor = COMPRESSION_CODECS[self.codec][1]()
+        self._buffer = bytearray()
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size):
+        while len(self._buffer) < size and not self._eof:
+            data = self.raw.read(settings.DATABASE_STORAGE_CHUNK_SIZE)
+            if data:
+                self._buffer.extend(self._decompressor.decompress(data))
+            else:
+                if hasattr(self._decompressor, 'flush'):
+                    self._buffer.extend(self._decompressor.flush())
+                self._eof = True
+
+    def read(self, size=-1):
+        remaining = self.size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+
+        self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise IOError("Negative seek position {}".format(offset))
+
+        if offset < self._position:
+            self._rewind()
+
+        while self._position < min(offset, self.size):
+            skipped = self.read(min(offset - self._position,
+                settings.DATABASE_STORAGE_CHUNK_SIZE))
+            if not skipped:
+                break
+
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def close(self):
+        self.raw.close()
+        self._buffer = bytearray()
+        self.closed = True
+
+class BinaryDatabaseStorage(CachedStorageMixin, Storage):
+    """
+    Class BinaryDatabaseStorage provides storing files in the database as raw
+    bytes, without the size and encoding overhead of `Base64DatabaseStorage`.
+    Use `migrate_base64_files` to move existing files over.
+
+    Uploads are read with `content.chunks()` and files larger than
+    `settings.DATABASE_STORAGE_CHUNK_SIZE` are split into chunk rows, which
+    opened files fetch on demand (see `DatabaseFileReader`).
+
+    If `settings.DATABASE_STORAGE_COMPRESSION` names a codec, compressible
+    files are stored compressed when that saves enough space, and are
+    decompressed as they're read. The codec is recorded per file, so files
+    saved before (or with a different codec) remain readable.
+    """
+    cache_prefix = 'binary'
+
+    def _metadata_queryset(self):
+        return BinaryUploadedFile.objects.defer('data')
+
+    def _metadata_from(self, uploaded_file):
+        metadata = self._build_metadata(uploaded_file.filename,
+                uploaded_file.size, uploaded_file.updated_on)
+        metadata['digest'] = uploaded_file.digest
+        return metadata
+
+    def _open(self, name, mode='rb'):
+        assert mode == 'rb', "You've tried to open binary file without specifying binary mode! You specified: %s" % mode
+
+        file = self._open_cached(name, mode)
+        if file is None:
+            uploaded_file = BinaryUploadedFile.objects.get(filename=name)
+            self._cache_metadata(name, self._metadata_from(uploaded_file))
+            file = self._open_uploaded_file(uploaded_file, name, mode)
+        return file
+
+    def _open_cached(self, name, mode):
+        content = self._cached_content(name)
+        if content is not None:
+            file = io.BytesIO(content)
+            file.name = name
+            file.mode = mode
+            return File(file, name)
+
+    def _open_uploaded_file(self, uploaded_file, name, mode):
+        file = DatabaseFileReader(uploaded_file, name, mode)
+        if uploaded_file.codec:
+            file = DecompressingFileReader(file, uploaded_file.codec,
+                    uploaded_file.size)
+
+        if not uploaded_file.chunk_size \
+                and uploaded_file.size <= settings.DATABASE_STORAGE_CACHE_MAX_FILE_SIZE:
+            self._cache_content(name, file.read())
+            file.seek(0)
+        return File(file, name)
+
+    def _compress(self, content, codec):
+        """
+        Compresses `content` into a temporary file. Returns the file, the
+        compressed size, and the size and digest of the original content.
+        """
+        compressor = COMPRESSION_CODECS[codec][0](
+                settings.DATABASE_STORAGE_COMPRESSION_LEVEL)
+        digest = hashlib.sha256()
+        size = 0
+
+        spool = tempfile.SpooledTemporaryFile(
+                max_size=settings.DATABASE_STORAGE_CHUNK_SIZE)
+        for data in _byte_chunks(content):
+            digest.update(data)
+            size += len(data)
+            spool.write(compressor.compress(data))
+        spool.write(compressor.flush())
+
+        compressed_size = spool.tell()
+        spool.seek(0)
+        return spool, compressed_size, size, digest.hexdigest()
+
+    def _write(self, name, content, mime_type=None):
+        codec = settings.DATABASE_STORAGE_COMPRESSION
+        if mime_type is None:
+            mime_type, encoding = mimetypes.guess_type(name)
+
+        if codec and _is_compressible(mime_type):
+            spool, compressed_size, size, digest = self._compress(content, codec)
+            try:
+                if compressed_size < size * settings.DATABASE_STORAGE_COMPRESSION_MIN_RATIO:
+                    return self._write_blob(name, File(spool), codec=codec,
+                            size=size, digest=digest)
+            finally:
+                spool.close()
+
+        return self._write_blob(name, content)
+
+    def _write_blob(self, name, content, codec='', size=None, digest=None):
+        chunk_size = settings.DATABASE_STORAGE_CHUNK_SIZE
+        hasher = hashlib.sha256() if digest is None else None
+
+        chunks = _fixed_size_chunks(content, chunk_size, hasher)
+        first = next(chunks, b'')
+        second = next(chunks, None)
+
+        with transaction.atomic():
+            if second is None:
+                defaults = {
+                    'data': first,
+                    'size': len(first) if size is None else size,
+                    'chunk_size': 0,
+                    'digest': hasher.hexdigest() if digest is None else digest,
+                    'codec': codec,
+                    'compressed_size': len(first) if codec else None }
+            else:
+                defaults = {
+                    'data': b'',
+                    'size': 0,
+                    'chunk_size': chunk_size,
+                    'digest': '',
+                    'codec': codec,
+                    'compressed_size': None }
+
+            uploaded_file, _ = BinaryUploadedFile.objects.update_or_create(
+                    filename=name, defaults=defaults)
+            BinaryUploadedFileChunk.objects.filter(file=uploaded_file).delete()
+
+            if second is not None:
+                stored_size = 0
+                for index, data in enumerate(itertools.chain([first, second], chunks)):
+                    BinaryUploadedFileChunk.objects.create(
+                            file=uploaded_file, index=index, data=data)
+                    stored_size += len(data)
+
+                uploaded_file.size = stored_size if size is None else size
+                uploaded_file.digest = hasher.hexdigest() if digest is None else digest
+                if codec:
+                    uploaded_file.compressed_size = stored_size
+                BinaryUploadedFile.objects \
+                        .filter(pk=uploaded_file.pk) \
+                        .update(size=uploaded_file.size,
+                                digest=uploaded_file.digest,
+                                compressed_size=uploaded_file.compressed_size)
+
+        return uploaded_file
+
+    def _save(self, name, content):
+        name = name.replace('\\', '/')
+        self._write(name, content)
+        self._invalidate_on_commit(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def delete(self, name):
+        BinaryUploadedFile.objects.filter(filename=name).delete()
+        self._invalidate_on_commit(name)
+
+    def _data_url(self, name):
+        data = self._open(name).read()
+        return "data:{0};base64,{1}".format(self.metadata(name)['mime_type'],
+                base64.b64encode(data).decode('ascii'))
+
+    def _inline_data(self, names):
+        return BinaryUploadedFile.objects \
+                .filter(filename__in=names) \
+                .values_list('filename', 'data', 'chunk_size', 'codec')
+
+    def _data_urls(self, names):
+        # Small, uncompressed files are encoded straight from one query; the
+        # rest are read one by one.
+        urls = {}
+        remaining = []
+        names = list(set(names))
+        batch_size = settings.DATABASE_STORAGE_BATCH_SIZE
+        for i in range(0, len(names), batch_size):
+            for name, data, chunk_size, codec in self._inline_data(names[i:i + batch_size]):
+                if chunk_size or codec:
+                    remaining.append(name)
+                    continue
+
+                mime_type, encoding = mimetypes.guess_type(name)
+                urls[name] = "data:{0};base64,{1}".format(mime_type,
+                        base64.b64encode(bytes(data)).decode('ascii'))
+
+        for name in remaining:
+            urls[name] = self._data_url(name)
+        return urls
+
+class DeduplicatingDatabaseStorage(BinaryDatabaseStorage):
+    """
+    Class DeduplicatingDatabaseStorage stores each distinct file content once,
+    as a `BinaryUploadedFile` named after its SHA-256 digest. Saved names are
+    `FileReference` rows pointing to that content, so uploading the same file
+    under many names writes it only once.
+
+    Content is hashed as it's read and spooled to a temporary file (kept in
+    memory up to `settings.DATABASE_STORAGE_CHUNK_SIZE` bytes) until the
+    digest is known. Deleting a name drops the content only once no other name
+    references it.
+    """
+    cache_prefix = 'deduplicated'
+    content_prefix = 'sha256/'
+    name_field = 'name'
+
+    def _metadata_queryset(self):
+        return FileReference.objects \
+                .select_related('file') \
+                .defer('file__data')
+
+    def _metadata_from(self, reference):
+        metadata = self._build_metadata(reference.name, reference.file.size,
+                reference.updated_on)
+        metadata['digest'] = reference.file.digest
+        return metadata
+
+    def _inline_data(self, names):
+        return FileReference.objects \
+                .filter(name__in=names) \
+                .values_list('name', 'file__data', 'file__chunk_size', 'file__codec')
+
+    def _content_name(self, name):
+        return self.content_prefix + self.metadata(name)['digest']
+
+    def _open(self, name, mode='rb'):
+        assert mode == 'rb', "You've tried to open binary file without specifying binary mode! You specified: %s" % mode
+
+        file = self._open_cached(name, mode)
+        if file is None:
+            uploaded_file = BinaryUploadedFile.objects.get(
+                    filename=self._content_name(name))
+            file = self._open_uploaded_file(uploaded_file, name, mode)
+        return file
+
+    def _save(self, name, content):
+        name = name.replace('\\', '/')
+        digest = hashlib.sha256()
+        spool = tempfile.SpooledTemporaryFile(
+                max_size=settings.DATABASE_STORAGE_CHUNK_SIZE)
+        for data in _byte_chunks(content):
+            digest.update(data)
+            spool.write(data)
+        spool.seek(0)
+
+        content_name = self.content_prefix + digest.hexdigest()
+        with transaction.atomic():
+            # Lock the content row so that a concurrent delete can't drop it
+            # between here and the reference being saved.
+            uploaded_file = BinaryUploadedFile.objects \
+                    .select_for_update() \
+                    .defer('data') \
+                    .filter(filename=content_name) \
+                    .first()
+            if uploaded_file is None:
+                mime_type, encoding = mimetypes.guess_type(name)
+                uploaded_file = self._write(content_name, File(spool), mime_type)
+            spool.close()
+
+            reference, created = FileReference.objects \
+                    .select_for_update() \
+                    .get_or_create(name=name, defaults={'file': uploaded_file})
+            if not created and reference.file_id != uploaded_file.pk:
+                previous_file_id = reference.file_id
+                reference.file = uploaded_file
+                reference.save()
+                self._release(previous_file_id)
+
+        self._invalidate_on_commit(name)
+        return name
+
+    def _release(self, file_id):
+        uploaded_file = BinaryUploadedFile.objects \
+                .select_for_update() \
+                .defer('data') \
+                .filter(pk=file_id) \
+                .first()
+        if uploaded_file is not None \
+                and not FileReference.objects.filter(file_id=file_id).exists():
+            uploaded_file.delete()
+            self._invalidate_on_commit(uploaded_file.filename)
+
+    def delete(self, name):
+        with transaction.atomic():
+            reference = FileReference.objects \
+                    .select_for_update() \
+                    .filter(name=name) \
+                    .first()
+            if reference is not None:
+                reference.delete()
+                self._release(reference.file_id)
+
+        self._invalidate_on_commit(name)
+
+
+def migrate_base64_files(batch_size=100, delete=False):
+    """
+    Copies the files stored by `Base64DatabaseStorage` into
+    `BinaryDatabaseStorage`, decoding each blob once. Files are written like
+    `BinaryDatabaseStorage` saves them, so files larger than
+    `settings.DATABASE_STORAGE_CHUNK_SIZE` are split into chunk rows (and
+    compressed if compression is enabled). Files that already exist in the
+    binary storage are skipped, so an interrupted migration can simply be run
+    again.
+
+    :param batch_size: number of files to read and copy per transaction
+    :type batch_size: int
+
+    :param delete: whether to delete the base64 rows once they're copied
+    :type delete: bool
+
+    Returns the number of files copied.
+    """
+    storage = BinaryDatabaseStorage()
+    copied = 0
+    last_pk = None
+    while True:
+        batch = UploadedFile.objects.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+
+        existing = set(BinaryUploadedFile.objects
+                .filter(filename__in=[obj.filename for obj in batch])
+                .values_list('filename', flat=True))
+
+        with transaction.atomic():
+            for obj in batch:
+                if obj.filename in existing:
+                    continue
+
+                existing.add(obj.filename)
+                storage._write(obj.filename,
+                        ContentFile(base64.b64decode(obj.blob)))
+                storage._invalidate_on_commit(obj.filename)
+                copied += 1
+
+            if delete:
+                UploadedFile.objects.filter(pk__in=[obj.pk for obj in batch]).delete()
+                for obj in batch:
+                    Base64DatabaseStorage().invalidate(obj.filename)
+
+        last_pk = batch[-1].pk
+
+    return copied
+
+
+class _HashingReader(object):
+    """
+    Wraps a file object and hashes what's read from it. Seeking back to the
+    start (as `File.chunks()` does) starts the hash over.
+    """
+
+    def __init__(self, file, size):
+        self.file = file
+        self.size = size
+        self.name = getattr(file, 'name', None)
+        self.mode = 'rb'
+        self.closed = False
+        self._reset()
+
+    def _reset(self):
+        self.digest = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self.digest.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset == 0 and whence == io.SEEK_SET:
+            self._reset()
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+        self.closed = True
+
+def _file_digest(storage, name):
+    digest = hashlib.sha256()
+    file = storage.open(name, 'rb')
+    try:
+        for data in _byte_chunks(file):
+            digest.update(data)
+    finally:
+        file.close()
+    return digest.hexdigest()
+
+def _storage_digest(storage, name):
+    # The database storages record digests; others are read and hashed.
+    if hasattr(storage, 'digest'):
+        return storage.digest(name)
+    return _file_digest(storage, name)
+
+def _is_same_file(source, destination, name):
+    return source.size(name) == destination.size(name) \
+            and _storage_digest(source, name) == _storage_digest(destination, name)
+
+def walk_files(storage, path=''):
+    """
+    Yields the name of every file in `storage` under `path`, using
+    `listdir`.
+    """
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield name if not path else '/'.join((path.rstrip('/'), name))
+    for directory in directories:
+        subdirectory = directory if not path else '/'.join((path.rstrip('/'), directory))
+        for name in walk_files(storage, subdirectory):
+            yield name
+
+def copy_file(source, destination, name, overwrite=False, verify=True):
+    """
+    Copies a single file from `source` to `destination`, streaming it with
+    `File.chunks()` and hashing it on the way. Returns the number of bytes
+    copied, or `None` if the file already existed and `overwrite` is false.
+
+    If `verify` is true, the copy is read back and compared with the digest
+    of the source, raising `IOError` if they differ, and an existing file is
+    only kept if its size and digest match the source (so that a partial
+    copy left by an interrupted run is replaced). A copy that fails or
+    doesn't verify is deleted from `destination`.
+    """
+    if destination.exists(name):
+        if not overwrite and (not verify or _is_same_file(source, destination, name)):
+            return None
+        destination.delete(name)
+
+    reader = _HashingReader(source.open(name, 'rb'), source.size(name))
+    try:
+        saved_name = destination.save(name, File(reader, name))
+    except Exception:
+        if destination.exists(name):
+            destination.delete(name)
+        raise
+    finally:
+        reader.close()
+
+    if saved_name != name:
+        destination.delete(saved_name)
+        raise IOError("{} was saved as {}".format(name, saved_name))
+
+    if verify and _file_digest(destination, name) != reader.digest.hexdigest():
+        destination.delete(name)
+        raise IOError("Checksum mismatch for {}".format(name))
+
+    return reader.bytes_read
+
+def copy_files(source, destination, names=None, workers=4, checkpoint=None,
+        overwrite=False, verify=True, progress=None):
+    """
+    Copies files between any two Django storages using a pool of `workers`
+    threads (see `copy_file`).
+
+    :param names: the names to copy (default: every file in `source`, found
+    with `walk_files`)
+    :type names: iterable
+
+    :param checkpoint: path of a file listing the names that have been
+    copied, one per line. Names already listed are skipped and new ones are
+    appended as they're copied, so an interrupted copy can be resumed.
+    :type checkpoint: str
+
+    :param progress: called with the statistics after each file
+    :type progress: function
+
+    Returns a dictionary with the number of files `copied`, `skipped` and
+    `failed`, the `errors` by name, the number of `bytes` copied and the
+    elapsed `seconds`.
+    """
+    if names is None:
+        names = walk_files(source)
+
+    done = set()
+    checkpoint_file = None
+    if checkpoint is not None:
+        try:
+            with io.open(checkpoint, encoding='utf-8') as f:
+                done = set(line.rstrip('\n') for line in f)
+        except IOError:
+            pass
+        checkpoint_file = io.open(checkpoint, 'a', encoding='utf-8')
+
+    stats = {
+        'copied': 0,
+        'skipped': 0,
+        'failed': 0,
+        'errors': {},
+        'bytes': 0,
+        'seconds': 0 }
+    lock = threading.Lock()
+    queue = Queue(maxsize=workers * 4)
+    start = time.time()
+
+    def work():
+        try:
+            while True:
+                name = queue.get()
+                if name is None:
+                    break
+
+                try:
+                    copied = copy_file(source, destination, name,
+                            overwrite=overwrite, verify=verify)
+                    error = None
+                except Exception as e:
+                    copied = None
+                    error = e
+
+                with lock:
+                    if error is not None:
+                        stats['failed'] += 1
+                        stats['errors'][name] = str(error)
+                    else:
+                        if copied is None:
+                            stats['skipped'] += 1
+                        else:
+                            stats['copied'] += 1
+                            stats['bytes'] += copied
+
+                        if checkpoint_file is not None:
+                            checkpoint_file.write(name + u'\n')
+                            checkpoint_file.flush()
+
+                    stats['seconds'] = time.time() - start
+                    if progress is not None:
+                        progress(stats)
+        finally:
+            # Worker threads open their own connections; don't leak them.
+            for connection in connections.all():
+                connection.close()
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for name in names:
+            if name in done:
+                stats['skipped'] += 1
+            else:
+                queue.put(name)
+    finally:
+        for thread in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
 
+        if checkpoint_file is not None:
+            checkpoint_file.close()
 
+    stats['seconds'] = time.time() - start
+    return stats
@@ -0,0 +1,357 @@
+# Copyright 2015-2017 Lionheart Software LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import random
+import threading
+import unittest
+
+from django.core.cache import cache
+from django.db import connection, connections, models
+from django.test import TestCase, TransactionTestCase
+
+from lionheart.admin import export_as_csv_action
+from lionheart.models import (DirtyFieldsMixin, Orderable, SlugField,
+        SoftDeleteManager, SoftDeleteMixin, _object_cache)
+from lionheart.utils import bulk_create_with_slugs
+
+
+class ExportTagGroup(models.Model):
+    name = models.CharField(max_length=20)
+
+    class Meta:
+        app_label = 'lionheart'
+        ordering = ('pk',)
+
+    def __str__(self):
+        return self.name
+
+
+class ExportTag(models.Model):
+    name = models.CharField(max_length=20)
+    group = models.ForeignKey(ExportTagGroup, on_delete=models.CASCADE)
+
+    class Meta:
+        app_label = 'lionheart'
+        ordering = ('name',)
+
+    def __str__(self):
+        return self.name
+
+
+class ExportBook(models.Model):
+    title = models.CharField(max_length=50)
+    tags = models.ManyToManyField(ExportTag)
+
+    class Meta:
+        app_label = 'lionheart'
+        ordering = ('pk',)
+
+
+class OrderedEntry(Orderable):
+    name = models.CharField(max_length=20)
+    board = models.IntegerField(default=1)
+
+    position_scope = ('board',)
+
+    class Meta(Orderable.Meta):
+        app_label = 'lionheart'
+
+
+class SoftDeleteNote(SoftDeleteMixin):
+    name = models.CharField(max_length=20)
+
+    objects = SoftDeleteManager()
+
+    class Meta:
+        app_label = 'lionheart'
+
+
+class CachedNote(SoftDeleteMixin):
+    name = models.CharField(max_length=20)
+
+    objects = SoftDeleteManager(cache_objects=True)
+
+    class Meta:
+        app_label = 'lionheart'
+
+
+class SluggedNote(SoftDeleteMixin):
+    title = models.CharField(max_length=50)
+    slug = SlugField(max_length=20)
+
+    objects = SoftDeleteManager()
+
+    class Meta:
+        app_label = 'lionheart'
+
+
+class DirtyNote(DirtyFieldsMixin):
+    name = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'lionheart'
+
+
+class ExportModelAdmin(object):
+    model = ExportBook
+
+
+class M2MExportTestCase(TestCase):
+    m2m_fields = [{
+        'name': 'tags',
+        'group_by_name': 'group',
+        'group_by_model': ExportTagGroup }]
+
+    def create_books(self, count):
+        groups = [ExportTagGroup.objects.create(name="group-{}".format(i))
+                  for i in range(3)]
+        tags = [ExportTag.objects.create(name="tag-{}".format(i),
+                                         group=groups[i % len(groups)])
+                for i in range(7)]
+        for i in range(count):
+            book = ExportBook.objects.create(title="book-{}".format(i))
+            book.tags.set(tags[i % 4:i % 4 + 3])
+
+    def export(self):
+        action = export_as_csv_action("books.csv", fields=['id', 'title'],
+                                      m2m_fields=self.m2m_fields)
+        response = action(ExportModelAdmin(), None, ExportBook.objects.all())
+        return list(csv.reader(io.StringIO(response.content.decode('utf-8'))))
+
+    def expected_rows(self):
+        groups = list(ExportTagGroup.objects.all())
+        rows = [['id', 'title'] + [group.name for group in groups]]
+        for book in ExportBook.objects.all():
+            row = [str(book.id), book.title]
+            for group in groups:
+                related = book.tags.filter(group=group)
+                row.append(", ".join(map(str, related)))
+            rows.append(row)
+        return rows
+
+    def test_output_matches_per_row_queries(self):
+        self.create_books(10)
+        self.assertEqual(self.export(), self.expected_rows())
+
+    def test_query_count_is_independent_of_row_count(self):
+        # One query for the groups and one for the rows, then three per m2m
+        # field for the chunk (through table, related objects, their groups).
+        self.create_books(5)
+        with self.assertNumQueries(5):
+            self.export()
+
+        self.create_books(50)
+        with self.assertNumQueries(5):
+            self.export()
+
+
+class OrderableTestCase(TestCase):
+    def names(self, board=1):
+        return list(OrderedEntry.objects
+                    .filter(board=board)
+                    .values_list('name', flat=True))
+
+    def test_save_appends_per_scope(self):
+        first = OrderedEntry.objects.create(name="a")
+        second = OrderedEntry.objects.create(name="b")
+        other = OrderedEntry.objects.create(name="c", board=2)
+        self.assertEqual(first.position, 0)
+        self.assertEqual(second.position, Orderable.position_gap)
+        self.assertEqual(other.position, 0)
+
+    def test_bulk_create_without_positions(self):
+        OrderedEntry.objects.bulk_create([
+            OrderedEntry(name="e{}".format(i)) for i in range(3)])
+        self.assertEqual(
+            list(OrderedEntry.objects.values_list('position', flat=True)),
+            [0, 0, 0])
+
+        OrderedEntry.reorder(OrderedEntry.objects.values_list('pk', flat=True))
+        self.assertEqual(self.names(), ["e0", "e1", "e2"])
+        entry = OrderedEntry.objects.create(name="e3")
+        self.assertEqual(entry.position, 3 * Orderable.position_gap)
+
+    def test_random_moves_match_list_operations(self):
+        rng = random.Random(19)
+        entries = [OrderedEntry.objects.create(name="e{}".format(i))
+                   for i in range(30)]
+        OrderedEntry.objects.create(name="other", board=2)
+        expected = self.names()
+
+        for _ in range(300):
+            entry = rng.choice(entries)
+            entry.refresh_from_db()
+            expected.remove(entry.name)
+            operation = rng.choice(['before', 'after', 'to'])
+            if operation == 'to':
+                index = rng.randint(0, 35)
+                entry.move_to(index)
+                expected.insert(min(index, len(expected)), entry.name)
+            else:
+                target = rng.choice([e for e in entries if e.pk != entry.pk])
+                getattr(entry, 'move_' + operation)(target)
+                index = expected.index(target.name)
+                if operation == 'after':
+                    index += 1
+                expected.insert(index, entry.name)
+            self.assertEqual(self.names(), expected)
+
+        self.assertEqual(self.names(board=2), ["other"])
+
+    def test_moves_rebalance_when_out_of_room(self):
+        entries = [OrderedEntry.objects.create(name="e{}".format(i))
+                   for i in range(3)]
+        OrderedEntry._set_positions((e.pk, i) for i, e in enumerate(entries))
+
+        entries[2].move_after(entries[0])
+        self.assertEqual(self.names(), ["e0", "e2", "e1"])
+        self.assertEqual(
+            list(OrderedEntry.objects.values_list('position', flat=True)),
+            [0, Orderable.position_gap // 2, Orderable.position_gap])
+
+    def test_move_updates_only_the_moved_row(self):
+        entries = [OrderedEntry.objects.create(name="e{}".format(i))
+                   for i in range(5)]
+        entries[4].move_before(entries[1])
+        self.assertEqual(self.names(), ["e0", "e4", "e1", "e2", "e3"])
+        self.assertEqual(
+            [e.position for e in OrderedEntry.objects.exclude(pk=entries[4].pk)],
+            [e.position for e in entries[:4]])
+
+
+def _in_memory_test_database():
+    test_name = connection.settings_dict.get('TEST', {}).get('NAME')
+    return connection.vendor == 'sqlite' and test_name in (None, '', ':memory:')
+
+
+@unittest.skipIf(_in_memory_test_database(),
+                 "Concurrent writers need a file-based or server test database.")
+class OrderableConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_appends_get_distinct_positions(self):
+        errors = []
+
+        def append():
+            try:
+                for _ in range(10):
+                    OrderedEntry.objects.create(name="e", board=7)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=append) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        positions = list(OrderedEntry.objects
+                         .filter(board=7)
+                         .values_list('position', flat=True))
+        self.assertEqual(len(positions), 60)
+        self.assertEqual(len(set(positions)), 60)
+
+
+class SoftDeleteTestCase(TestCase):
+    def setUp(self):
+        # Test transactions are rolled back, so primary keys get reused.
+        _object_cache.clear()
+        cache.clear()
+
+    def test_queryset_delete_is_a_single_update(self):
+        for i in range(5):
+            SoftDeleteNote.objects.create(name="n{}".format(i))
+        SoftDeleteNote.objects.filter(name="n0").delete()
+
+        with self.assertNumQueries(1):
+            count, counts = SoftDeleteNote.objects.all().delete()
+        self.assertEqual(count, 4)
+        self.assertEqual(counts, {'lionheart.SoftDeleteNote': 4})
+        self.assertEqual(SoftDeleteNote.objects.count(), 0)
+        self.assertEqual(SoftDeleteNote.objects.deleted.count(), 5)
+
+    def test_cached_pk_lookups_take_no_queries(self):
+        note = CachedNote.objects.create(name="a")
+        with self.assertNumQueries(1):
+            CachedNote.objects.get(pk=note.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedNote.objects.get(pk=note.pk).name, "a")
+            self.assertEqual(CachedNote.objects.get(id=note.pk).name, "a")
+
+    def test_cached_objects_are_invalidated(self):
+        note = CachedNote.objects.create(name="a")
+        CachedNote.objects.get(pk=note.pk)
+
+        note.name = "b"
+        note.save()
+        self.assertEqual(CachedNote.objects.get(pk=note.pk).name, "b")
+
+        CachedNote.objects.filter(pk=note.pk).delete()
+        self.assertEqual(CachedNote.objects.get(pk=note.pk).deleted,
+                         SoftDeleteMixin.DELETED)
+        with self.assertRaises(CachedNote.DoesNotExist):
+            CachedNote.objects.get(pk=note.pk, deleted=SoftDeleteMixin.OK)
+
+        other = CachedNote.objects.create(name="c")
+        CachedNote.objects.get(pk=other.pk)
+        CachedNote.objects.filter(pk=other.pk).delete(send_signals=True)
+        self.assertEqual(CachedNote.objects.get(pk=other.pk).deleted,
+                         SoftDeleteMixin.DELETED)
+
+        CachedNote.objects.get(pk=note.pk).remove_permanently()
+        with self.assertRaises(CachedNote.DoesNotExist):
+            CachedNote.objects.get(pk=note.pk)
+
+
+class SlugTestCase(TestCase):
+    def test_bulk_create_avoids_soft_deleted_slugs(self):
+        SluggedNote.objects.create(title="x", slug="hello-world")
+        SluggedNote.objects.create(title="x", slug="hello-world-2").delete()
+
+        notes = bulk_create_with_slugs(
+            [SluggedNote(title="Hello World") for _ in range(2)],
+            source='title')
+        self.assertEqual([note.slug for note in notes],
+                         ["hello-world-3", "hello-world-4"])
+
+
+class DirtyFieldsTestCase(TestCase):
+    def test_clearing_the_pk_saves_a_copy(self):
+        note = DirtyNote.objects.get(pk=DirtyNote.objects.create(name="a").pk)
+        original_pk = note.pk
+        note.pk = None
+        note.count = 1
+        note.save()
+
+        self.assertNotEqual(note.pk, original_pk)
+        self.assertEqual(DirtyNote.objects.get(pk=original_pk).count, 0)
+        self.assertEqual(DirtyNote.objects.get(pk=note.pk).count, 1)
+
+    def test_refresh_from_db_takes_a_new_snapshot(self):
+        note = DirtyNote.objects.create(name="a")
+        DirtyNote.objects.filter(pk=note.pk).update(count=5)
+        note.refresh_from_db()
+        self.assertEqual(note.get_dirty_fields(), [])
+
+        note = DirtyNote.objects.only('name').get(pk=note.pk)
+        self.assertEqual(note.count, 5)
+        self.assertEqual(note.get_dirty_fields(), [])
+        note.count = 6
+        with self.assertNumQueries(1):
+            note.save()
+        self.assertEqual(DirtyNote.objects.get(pk=note.pk).count, 6)
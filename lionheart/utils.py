@@ -12,14 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 import datetime
 import json
 import random
 import re
 import string
+import threading
 import time
 import unicodedata
 
+from django.db import IntegrityError
+from django.db import models
+from django.db import transaction
 from django.http import HttpResponse
 from django.utils.functional import lazy
 
@@ -82,7 +87,7 @@ def slugify(phrase, simple=True):
         alphanumeric = re.compile(r'[^a-zA-Z0-9]+')
         slug = alphanumeric.sub('-', phrase.lower()).strip('-')
         if len(slug) == 0:
-            return random.choice(string.lowercase)
+            return random.choice(getattr(string, 'lowercase', string.ascii_lowercase))
         return slug
     else:
         from nltk import pos_tag, word_tokenize
@@ -200,5 +205,206 @@ def random_string(length):
     return ''.join(random.choice(alphanumeric) for _ in range(length))
 
 
+def allocate_slugs(queryset, phrases, field='slug', simple=True, max_length=None,
+        batch_size=200):
+    """
+    Returns a unique slug for each of `phrases`, not used by any row of
+    `queryset` or by another phrase in the batch. Repeated slugs get numeric
+    suffixes ("title", "title-2", "title-3", ...).
+
+    Existing slugs are found with one query per `batch_size` distinct slugs
+    (OR'ing a prefix match for each), and suffixes are handed out in memory.
+    Rows inserted concurrently can still collide; see
+    `bulk_create_with_slugs` for a version that retries.
+
+    :param queryset: the model or queryset whose slugs must be avoided. For a
+    model, every row counts, including ones its default manager hides (such
+    as soft-deleted rows, which a unique index still covers); a queryset is
+    used as given.
+    :type queryset: Model or QuerySet
+
+    :param max_length: the length of the slug field, if slugs (including
+    their suffix) should be truncated to it
+    :type max_length: int
+    """
+    if isinstance(queryset, type) and issubclass(queryset, models.Model):
+        queryset = queryset._base_manager.all()
+
+    bases = [slugify(phrase, simple) for phrase in phrases]
+    if max_length is not None:
+        bases = [base[:max_length] for base in bases]
+
+    def get_root(base):
+        # Leave room for a suffix of up to 8 characters when truncating.
+        if max_length is not None and len(base) > max_length - 8:
+            return base[:max_length - 8]
+        return base
+
+    taken = set()
+    distinct_bases = list(set(bases))
+    for i in range(0, len(distinct_bases), batch_size):
+        query = models.Q()
+        for base in distinct_bases[i:i + batch_size]:
+            root = get_root(base)
+            if root == base:
+                query |= models.Q(**{field: base})
+                query |= models.Q(**{field + '__startswith': base + '-'})
+            else:
+                query |= models.Q(**{field + '__startswith': root})
+        taken.update(queryset.filter(query).values_list(field, flat=True))
+
+    slugs = []
+    for base in bases:
+        slug = base
+        suffix = 1
+        while slug in taken:
+            suffix += 1
+            tail = '-{}'.format(suffix)
+            if max_length is None:
+                slug = base + tail
+            else:
+                slug = base[:max_length - len(tail)] + tail
+
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def bulk_create_with_slugs(objects, source, field='slug', retries=3,
+        simple=True, batch_size=None):
+    """
+    Assigns unique slugs generated from the `source` attribute of each of
+    `objects` (with `allocate_slugs`) and inserts them with `bulk_create`.
+    If another process takes one of the slugs first, the insert is rolled
+    back and retried with fresh slugs, up to `retries` times.
+
+        bulk_create_with_slugs(articles, source='title')
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+
+    model = objects[0].__class__
+    max_length = model._meta.get_field(field).max_length
+    phrases = [getattr(obj, source) for obj in objects]
+
+    for attempt in range(retries + 1):
+        slugs = allocate_slugs(model, phrases, field, simple, max_length)
+        for obj, slug in zip(objects, slugs):
+            setattr(obj, field, slug)
+
+        try:
+            with transaction.atomic():
+                return model._default_manager.bulk_create(objects,
+                        batch_size=batch_size)
+        except IntegrityError:
+            if attempt == retries:
+                raise
+
+
+def get_cache(alias):
+    """
+    Returns the Django cache configured under `alias` in `CACHES`, or None if
+    `alias` is None.
+    """
+    if alias is None:
+        return None
+
+    try:
+        from django.core.cache import caches
+    except ImportError:
+        # Django < 1.7
+        from django.core.cache import get_cache as get_django_cache
+        return get_django_cache(alias)
+    else:
+        return caches[alias]
+
+
+class LRUCache(object):
+    """
+    A thread-safe, in-process least-recently-used cache.
+
+    :param max_entries: the maximum number of entries kept
+    :type max_entries: int
+
+    :param max_size: if set, the maximum total size of the cached values, as
+    measured by `sizeof`
+    :type max_size: int
+
+    :param sizeof: function returning the size of a value (default: `len`)
+    :type sizeof: function
+
+    :param timeout: if set, the number of seconds after which an entry expires
+    :type timeout: int
+    """
+    def __init__(self, max_entries=1024, max_size=None, sizeof=len, timeout=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size, expires = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.time():
+                self._size -= size
+                self.misses += 1
+                return default
+
+            # Re-insert to mark the entry as the most recently used.
+            self._entries[key] = (value, size, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_size is not None else 0
+        if self.max_size is not None and size > self.max_size:
+            self.delete(key)
+            return
+
+        if self.timeout is None:
+            expires = None
+        else:
+            expires = time.time() + self.timeout
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size, expires)
+            self._size += size
+
+            while len(self._entries) > self.max_entries \
+                    or (self.max_size is not None and self._size > self.max_size):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._entries)
+
+
 reverse_lazy = lazy(reverse, str)
 
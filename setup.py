@@ -32,6 +32,10 @@ setup(
     description='Django decorators and some other utilities.',
     author=metadata['__author__'],
     author_email=metadata['__email__'],
-    packages=['lionheart']
+    packages=[
+        'lionheart',
+        'lionheart.management',
+        'lionheart.management.commands',
+    ]
 )
 